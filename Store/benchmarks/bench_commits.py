@@ -0,0 +1,65 @@
+"""Сравнение скорости фиксаций (commits/sec) для профилей движка.
+
+Для каждого профиля создается отдельная временная база, затем
+записываются продажи по одной, каждая своей транзакцией. С --threads N
+продажи идут из N потоков одновременно: без групповой фиксации и с ней
+(DatabaseManager.start_group_commit), когда одна транзакция
+фиксирует продажи всех ждущих потоков.
+
+Запуск из каталога Store:
+    python -m benchmarks.bench_commits --sales 2000 --threads 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.db_manager import DatabaseManager
+from database.engine import ENGINE_PROFILES
+from database.models import ProductCategory
+
+
+def bench_profile(profile, sales, threads=1, group_commit=False):
+    tmp_dir = tempfile.mkdtemp()
+    db = DatabaseManager(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", profile=profile)
+    product = db.add_product("Товар", ProductCategory.OTHER, 99.9, quantity=sales)
+    if group_commit:
+        db.start_group_commit()
+
+    def sell(count):
+        for _ in range(count):
+            db.record_sale(product.id, 1)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(sell, sales // threads) for _ in range(threads)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    db.stop_group_commit()
+    db.engine.dispose()
+    return sales // threads * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sales", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    modes = [("по одной", 1, False)]
+    if args.threads > 1:
+        modes += [(f"{args.threads} потоков", args.threads, False),
+                  (f"{args.threads} потоков, group commit", args.threads, True)]
+    results = {
+        (profile, mode): bench_profile(profile, args.sales, threads, group_commit)
+        for profile in ENGINE_PROFILES
+        for mode, threads, group_commit in modes
+    }
+    baseline = results[("default", modes[0][0])]
+    for (profile, mode), rate in results.items():
+        print(f"{profile:<12} {mode:<26} {rate:10.1f} sales/sec  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
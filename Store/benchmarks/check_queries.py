@@ -0,0 +1,69 @@
+"""Проверка отсутствия N+1 в отчетах и экспорте.
+
+Число SQL-запросов отчетов и экспорта не должно зависеть от числа
+строк. Скрипт заполняет временную базу и падает с AssertionError,
+если какой-то путь снова начал подгружать товар или клиента на
+каждую строку.
+
+Запуск из каталога Store:
+    python -m benchmarks.check_queries
+"""
+import os
+import tempfile
+
+from database.db_manager import DatabaseManager
+from database.models import ProductCategory
+from database.query_counter import QueryCounter
+from exports.exporter import DataExporter
+from reports.inventory_reports import InventoryReports
+
+ROWS = 50
+
+# Верхние границы числа запросов для каждого пути
+QUERY_LIMITS = {
+    "generate_sales_report": 6,
+    "generate_inventory_report": 1,
+    "export_to_excel": 4,
+    "export_to_excel_streaming": 4,
+    "get_products_page": 1,
+    "get_sales_page": 1,
+    "get_supplies_page": 1,
+}
+
+
+def seed(db):
+    customer = db.add_customer("Покупатель", "+70000000000", "buyer@example.com", 5)
+    for i in range(ROWS):
+        product = db.add_product(f"Товар {i}", ProductCategory.OTHER, 10.0 + i, quantity=5)
+        db.add_supply("Поставщик", product.id, 10, 100.0)
+        db.record_sale(product.id, 1, customer.id)
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    db = DatabaseManager(f"sqlite:///{os.path.join(tmp_dir, 'queries.db')}")
+    seed(db)
+    reports = InventoryReports(db)
+    exporter = DataExporter(db)
+
+    checks = {
+        "generate_sales_report": reports.generate_sales_report,
+        "generate_inventory_report": reports.generate_inventory_report,
+        "export_to_excel": lambda: exporter.export_to_excel(os.path.join(tmp_dir, "export.xlsx")),
+        "export_to_excel_streaming": lambda: exporter.export_to_excel_streaming(
+            os.path.join(tmp_dir, "export_streaming.xlsx")
+        ),
+        "get_products_page": db.get_products_page,
+        "get_sales_page": db.get_sales_page,
+        "get_supplies_page": db.get_supplies_page,
+    }
+    for name, check in checks.items():
+        with QueryCounter(db.engine) as counter:
+            check()
+        print(f"{name:<28} {counter.count} запросов")
+        counter.assert_at_most(QUERY_LIMITS[name])
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
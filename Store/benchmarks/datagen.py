@@ -0,0 +1,230 @@
+"""Генератор синтетических данных магазина для бенчмарков.
+
+Заполняет базу правдоподобным каталогом: товары всех категорий
+ProductCategory со штрихкодами и ценами по категориям, клиенты со
+скидками, продажи и поставки с сезонностью (декабрь и выходные
+нагружены сильнее, ночью продаж почти нет). Данные пишутся пакетами
+через executemany, без ORM-объектов; дневные итоги и журнал движений
+остатков пересчитываются в конце. При одинаковом seed получается
+одинаковая база.
+
+Запуск из каталога Store:
+    python -m benchmarks.datagen store_bench.db --sales 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update, bindparam
+
+from database.db_manager import DatabaseManager
+from database.models import Product, Customer, Sale, Supply, ProductCategory, to_money
+
+BATCH_SIZE = 50000
+
+# Диапазоны цен по категориям
+PRICE_RANGES = {
+    ProductCategory.ELECTRONICS: (990, 150000),
+    ProductCategory.CLOTHING: (490, 15000),
+    ProductCategory.FOOD: (39, 1500),
+    ProductCategory.BOOKS: (199, 3000),
+    ProductCategory.OTHER: (99, 5000),
+}
+
+# Доля категорий в каталоге
+CATEGORY_WEIGHTS = {
+    ProductCategory.ELECTRONICS: 15,
+    ProductCategory.CLOTHING: 25,
+    ProductCategory.FOOD: 35,
+    ProductCategory.BOOKS: 15,
+    ProductCategory.OTHER: 10,
+}
+
+NAME_WORDS = {
+    ProductCategory.ELECTRONICS: ["Смартфон", "Ноутбук", "Наушники", "Планшет", "Зарядка", "Колонка"],
+    ProductCategory.CLOTHING: ["Футболка", "Куртка", "Джинсы", "Свитер", "Кроссовки", "Шапка"],
+    ProductCategory.FOOD: ["Молоко", "Хлеб", "Сыр", "Кофе", "Чай", "Шоколад", "Яблоки"],
+    ProductCategory.BOOKS: ["Роман", "Учебник", "Справочник", "Сборник", "Комикс"],
+    ProductCategory.OTHER: ["Лампа", "Кружка", "Рюкзак", "Зонт", "Батарейки"],
+}
+BRANDS = ["Альфа", "Вега", "Орион", "Север", "Луч", "Нова", "Сокол", "Восток"]
+
+SUPPLIERS = [f"Поставщик {i}" for i in range(1, 41)]
+DISCOUNTS = [0, 0, 0, 0, 3, 5, 5, 7, 10, 15]
+
+# Сезонность: вес месяца, дня недели (пн=0) и часа дня
+MONTH_WEIGHTS = [0.8, 0.75, 0.9, 0.95, 1.0, 0.9, 0.85, 0.9, 1.0, 1.05, 1.2, 1.6]
+WEEKDAY_WEIGHTS = [0.85, 0.85, 0.9, 0.95, 1.1, 1.35, 1.2]
+HOUR_WEIGHTS = [0.02] * 8 + [0.4, 0.8, 1.0, 1.1, 1.3, 1.2, 1.0, 1.0, 1.1, 1.3, 1.5, 1.4, 1.0, 0.6] + [0.1] * 2
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(db, table, rows):
+    with db.engine.begin() as conn:
+        for batch in _batches(rows):
+            conn.execute(insert(table), batch)
+
+
+class TimestampSampler:
+    """Случайные моменты времени за период с учетом сезонности"""
+
+    def __init__(self, rnd, start, days):
+        self.rnd = rnd
+        self.days = [start + timedelta(days=d) for d in range(days)]
+        weights = [MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] for day in self.days]
+        self.day_cum = self._cumulative(weights)
+        self.hour_cum = self._cumulative(HOUR_WEIGHTS)
+
+    @staticmethod
+    def _cumulative(weights):
+        total = 0
+        result = []
+        for w in weights:
+            total += w
+            result.append(total)
+        return result
+
+    def sample(self, k):
+        days = self.rnd.choices(self.days, cum_weights=self.day_cum, k=k)
+        hours = self.rnd.choices(range(24), cum_weights=self.hour_cum, k=k)
+        return sorted(
+            day + timedelta(hours=hour, seconds=self.rnd.randrange(3600))
+            for day, hour in zip(days, hours)
+        )
+
+
+def generate(db, products=1000, customers=500, sales=10000, supplies=1000,
+             days=365, end=None, seed=42):
+    """Заполнить базу синтетическими данными, вернуть число строк по таблицам.
+
+    Продажи и поставки распределены за последние days дней до end.
+    Популярность товаров неравномерна: небольшая часть каталога дает
+    большую часть продаж. Остатки и суммы покупок клиентов
+    согласованы с записанными продажами.
+    """
+    rnd = random.Random(seed)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    sampler = TimestampSampler(rnd, start, days)
+
+    categories = list(CATEGORY_WEIGHTS)
+    category_weights = list(CATEGORY_WEIGHTS.values())
+    catalog = []
+    for i in range(products):
+        category = rnd.choices(categories, category_weights)[0]
+        low, high = PRICE_RANGES[category]
+        catalog.append({
+            'name': f"{rnd.choice(NAME_WORDS[category])} {rnd.choice(BRANDS)} {i + 1}",
+            'category': category,
+            'price': to_money(rnd.uniform(low, high)),
+            'quantity': rnd.randint(0, 500),
+            'min_stock': rnd.choice([5, 10, 10, 20, 50]),
+            'barcode': f"46{i + 1:011d}",
+            'description': None,
+            'created_at': start,
+        })
+    _insert(db, Product.__table__, catalog)
+
+    people = [{
+        'name': f"Клиент {i + 1}",
+        'phone': f"+79{i + 1:09d}",
+        'email': f"client{i + 1}@example.com",
+        'discount': float(rnd.choice(DISCOUNTS)),
+        'total_purchases': 0,
+        'created_at': start,
+    } for i in range(customers)]
+    _insert(db, Customer.__table__, people)
+
+    with db.engine.connect() as conn:
+        product_ids = [r.id for r in conn.execute(Product.__table__.select().order_by(Product.id))]
+        customer_ids = [r.id for r in conn.execute(Customer.__table__.select().order_by(Customer.id))]
+    prices = dict(zip(product_ids, (p['price'] for p in catalog)))
+    discounts = dict(zip(customer_ids, (c['discount'] for c in people)))
+    # Распределение популярности, близкое к закону Ципфа
+    popularity = TimestampSampler._cumulative([1 / (rank + 1) for rank in range(len(product_ids))])
+    purchases = dict.fromkeys(customer_ids, 0)
+
+    def sale_rows():
+        for date in sampler.sample(sales):
+            product_id = rnd.choices(product_ids, cum_weights=popularity)[0]
+            # Примерно треть продаж - без карты клиента
+            customer_id = rnd.choice(customer_ids) if customer_ids and rnd.random() > 0.3 else None
+            quantity = rnd.choices([1, 2, 3, 5], [70, 18, 8, 4])[0]
+            price = prices[product_id]
+            total = price * quantity
+            if customer_id:
+                total = to_money(total * (100 - to_money(discounts[customer_id])) / 100)
+                purchases[customer_id] += total
+            yield {'product_id': product_id, 'customer_id': customer_id, 'quantity': quantity,
+                   'price': price, 'total': total, 'date': date}
+
+    def supply_rows():
+        for date in sampler.sample(supplies):
+            product_id = rnd.choice(product_ids)
+            quantity = rnd.choice([10, 20, 50, 100, 200])
+            yield {'supplier': rnd.choice(SUPPLIERS), 'product_id': product_id, 'quantity': quantity,
+                   'cost': to_money(prices[product_id] * quantity * to_money(rnd.uniform(0.5, 0.75))),
+                   'date': date}
+
+    if product_ids:
+        _insert(db, Sale.__table__, sale_rows())
+        _insert(db, Supply.__table__, supply_rows())
+
+    with db.engine.begin() as conn:
+        table = Customer.__table__
+        conn.execute(
+            update(table).where(table.c.id == bindparam('cid')).values(total_purchases=bindparam('total')),
+            [{'cid': cid, 'total': total} for cid, total in purchases.items() if total]
+        )
+    db.rebuild_rollups()
+    db.rebuild_stock_ledger()
+    db.product_cache.clear()
+    db.customer_cache.clear()
+    return {'products': products, 'customers': customers, 'sales': sales, 'supplies': supplies}
+
+
+def sizes_for(rows):
+    """Размеры таблиц для базы примерно из rows продаж"""
+    return {
+        'products': max(rows // 10, 10),
+        'customers': max(rows // 20, 10),
+        'sales': rows,
+        'supplies': max(rows // 10, 10),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="файл базы SQLite")
+    parser.add_argument("--sales", type=int, default=10000)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--supplies", type=int)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = sizes_for(args.sales)
+    for name in ('products', 'customers', 'supplies'):
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    db = DatabaseManager(f"sqlite:///{args.path}")
+    started = time.perf_counter()
+    counts = generate(db, days=args.days, seed=args.seed, **sizes)
+    print(", ".join(f"{name}: {count}" for name, count in counts.items()))
+    print(f"Готово за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Нагрузочный тест сервера магазина: N касс одновременно.
+
+Каждая касса в цикле продает товары (80%), принимает поставки (5%) и
+читает карточки товаров (15%), ожидая ответа на каждый запрос, как
+настоящая касса. В конце печатаются пропускная способность и задержки
+(p50/p95/p99) по видам операций, а также средний размер пачки записей
+на сервере.
+
+По умолчанию сервер запускается отдельным процессом на временной базе,
+заполненной генератором datagen. Чтобы нагрузить уже работающий сервер,
+передайте --port без --spawn.
+
+Запуск из каталога Store:
+    python -m benchmarks.load_tills --spawn --tills 16 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from database.db_manager import DatabaseManager
+from benchmarks.datagen import generate, sizes_for
+from database.write_queue import MAX_BATCH, MAX_DELAY
+from server import StoreClient, HOST
+
+STORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def till(port, product_ids, customer_ids, deadline, latencies, errors, seed):
+    rnd = random.Random(seed)
+    client = await StoreClient.connect(HOST, port)
+    try:
+        while time.perf_counter() < deadline:
+            roll = rnd.random()
+            product_id = rnd.choice(product_ids)
+            if roll < 0.80:
+                op, args = 'record_sale', {
+                    'product_id': product_id,
+                    'quantity': rnd.choice([1, 1, 1, 2]),
+                    'customer_id': rnd.choice(customer_ids) if customer_ids and rnd.random() < 0.5 else None,
+                }
+            elif roll < 0.85:
+                op, args = 'add_supply', {
+                    'supplier': "Нагрузка", 'product_id': product_id, 'quantity': 50, 'cost': "1000.00",
+                }
+            else:
+                op, args = 'get_product', {'product_id': product_id}
+            started = time.perf_counter()
+            try:
+                await client.call(op, **args)
+            except Exception as e:
+                errors[op] = errors.get(op, 0) + 1
+                if "Недостаточно товара" not in str(e):
+                    errors.setdefault('messages', set()).add(str(e))
+            latencies.setdefault(op, []).append(time.perf_counter() - started)
+    finally:
+        await client.close()
+
+
+async def run_load(port, tills, seconds):
+    client = await StoreClient.connect(HOST, port)
+    products = await client.call('products_page', limit=5000)
+    customers = await client.call('customers_page', limit=1000)
+    await client.call('ping')
+    product_ids = [p['id'] for p in products]
+    customer_ids = [c['id'] for c in customers]
+
+    latencies = {}
+    errors = {}
+    started = time.perf_counter()
+    deadline = started + seconds
+    await asyncio.gather(*(
+        till(port, product_ids, customer_ids, deadline, latencies, errors, seed)
+        for seed in range(tills)
+    ))
+    elapsed = time.perf_counter() - started
+    stats = await client.call('stats')
+    await client.close()
+    return latencies, errors, elapsed, stats
+
+
+def spawn_server(db_path, port, max_batch, max_delay):
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--db", f"sqlite:///{db_path}", "--port", str(port),
+         "--max-batch", str(max_batch), "--max-delay", str(max_delay)],
+        cwd=STORE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    async def wait_ready():
+        for _ in range(100):
+            try:
+                client = await StoreClient.connect(HOST, port)
+                await client.call('ping')
+                await client.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        raise Exception("Сервер не запустился")
+
+    asyncio.run(wait_ready())
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tills", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--spawn", action="store_true", help="запустить сервер на временной базе")
+    parser.add_argument("--rows", type=int, default=10000, help="размер временной базы (продаж)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY)
+    args = parser.parse_args()
+
+    process = None
+    if args.spawn:
+        db_path = os.path.join(tempfile.mkdtemp(), "load.db")
+        db = DatabaseManager(f"sqlite:///{db_path}")
+        generate(db, **sizes_for(args.rows))
+        db.engine.dispose()
+        process = spawn_server(db_path, args.port, args.max_batch, args.max_delay)
+    try:
+        latencies, errors, elapsed, stats = asyncio.run(run_load(args.port, args.tills, args.seconds))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"Касс: {args.tills}, время: {elapsed:.1f} с, операций: {total} ({total / elapsed:.0f} оп/с)")
+    for op, values in sorted(latencies.items()):
+        print(
+            f"  {op:<12} {len(values):7} ({len(values) / elapsed:7.0f}/с)  "
+            f"p50 {percentile(values, 50) * 1000:7.2f} мс  p95 {percentile(values, 95) * 1000:7.2f} мс  "
+            f"p99 {percentile(values, 99) * 1000:7.2f} мс  ошибок {errors.get(op, 0)}"
+        )
+    if stats['batches']:
+        print(f"Пачек записей: {stats['batches']}, в среднем {stats['writes'] / stats['batches']:.1f}, "
+              f"максимум {stats['max_batch']}")
+    for message in sorted(errors.get('messages', ())):
+        print(f"  ошибка: {message}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Набор бенчмарков основных операций магазина на синтетических данных.
+
+Для каждого размера (число продаж; товары, клиенты и поставки -
+пропорционально, см. datagen.sizes_for) генерируется база, затем
+каждый случай запускается repeat раз и печатаются минимальное и
+медианное время одной операции. Сгенерированные базы кэшируются в
+--data-dir, а бенчмарк работает с их копией, так что запуски
+сравнимы между собой. Результаты можно сохранить в JSON (--output)
+и сравнить с предыдущим запуском (--compare).
+
+Запуск из каталога Store:
+    python -m benchmarks.run_benchmarks --sizes 10k 100k 1m --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database.db_manager import DatabaseManager
+from database.models import ProductCategory
+from exports.exporter import DataExporter
+from reports.inventory_reports import InventoryReports
+from benchmarks.datagen import generate, sizes_for
+
+DEFAULT_SIZES = ["10k", "100k", "1m"]
+# Быстрые операции меряются пачкой, время делится на число вызовов
+WRITE_OPS = 200
+
+
+def parse_size(text):
+    text = text.lower()
+    for suffix, factor in (("k", 1000), ("m", 1000000)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
+
+
+def prepare_database(rows, data_dir, work_dir):
+    """Копия сгенерированной базы из rows продаж (генерируется один раз)"""
+    cached = os.path.join(data_dir, f"bench_{rows}.db")
+    if not os.path.exists(cached):
+        started = time.perf_counter()
+        db = DatabaseManager(f"sqlite:///{cached}")
+        generate(db, **sizes_for(rows))
+        db.engine.dispose()
+        print(f"  база на {rows} продаж сгенерирована за {time.perf_counter() - started:.1f} с")
+    path = os.path.join(work_dir, f"bench_{rows}.db")
+    shutil.copyfile(cached, path)
+    return DatabaseManager(f"sqlite:///{path}")
+
+
+def benchmark_cases(db, work_dir):
+    """Случаи: имя -> (функция, число операций за один вызов)"""
+    reports = InventoryReports(db)
+    exporter = DataExporter(db)
+    product = db.add_product("Бенчмарк", ProductCategory.OTHER, 100.0, quantity=10 ** 9)
+    page = db.get_customers_page(limit=1)
+    customer = page[0].id if page else None
+    month_ago = datetime.now() - timedelta(days=30)
+
+    def record_sales():
+        for i in range(WRITE_OPS):
+            db.record_sale(product.id, 1, customer if i % 2 else None)
+
+    def add_supplies():
+        for _ in range(WRITE_OPS):
+            db.add_supply("Поставщик", product.id, 10, 500.0)
+
+    return {
+        "record_sale": (record_sales, WRITE_OPS),
+        "add_supply": (add_supplies, WRITE_OPS),
+        "get_low_stock_products": (db.get_low_stock_products, 1),
+        "get_total_sales_amount": (db.get_total_sales_amount, 1),
+        "get_total_sales_amount_30d": (lambda: db.get_total_sales_amount(month_ago), 1),
+        "generate_sales_report": (reports.generate_sales_report, 1),
+        "generate_inventory_report": (reports.generate_inventory_report, 1),
+        "generate_financial_report": (reports.generate_financial_report, 1),
+        "export_to_excel": (lambda: exporter.export_to_excel(os.path.join(work_dir, "export.xlsx")), 1),
+        "export_to_excel_streaming": (
+            lambda: exporter.export_to_excel_streaming(os.path.join(work_dir, "export_streaming.xlsx")), 1
+        ),
+    }
+
+
+def measure(fn, ops, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) / ops)
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "repeat": repeat,
+        "ops": ops,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="число продаж в базе, например 10k 100k 1m")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="запустить только эти случаи")
+    parser.add_argument("--skip", nargs="+", default=[], help="пропустить эти случаи")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "store_bench"))
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    for size in args.sizes:
+        rows = parse_size(size)
+        print(f"Размер {size} ({rows} продаж)")
+        work_dir = tempfile.mkdtemp()
+        try:
+            db = prepare_database(rows, args.data_dir, work_dir)
+            for name, (fn, ops) in benchmark_cases(db, work_dir).items():
+                if (args.only and name not in args.only) or name in args.skip:
+                    continue
+                key = f"{name}[{rows}]"
+                results[key] = measure(fn, ops, args.repeat)
+                line = f"  {name:<28} min {results[key]['min_ms']:10.3f} мс  median {results[key]['median_ms']:10.3f} мс"
+                if key in baseline:
+                    line += f"  x{baseline[key]['median_ms'] / results[key]['median_ms']:.2f}"
+                print(line)
+            db.engine.dispose()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Нагрузочная проверка продаж из нескольких процессов.
+
+Несколько процессов одновременно продают один и тот же товар из общей
+базы. Остаток не должен уйти в минус, а число проданных штук должно
+совпасть с уменьшением остатка.
+
+Запуск из каталога Store:
+    python -m benchmarks.stress_sales --workers 8 --attempts 50 --stock 200
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from database.db_manager import DatabaseManager
+from database.models import ProductCategory, Sale
+
+
+def _worker(db_url, product_id, attempts, results):
+    db = DatabaseManager(db_url)
+    sold = 0
+    rejected = 0
+    for _ in range(attempts):
+        try:
+            db.record_sale(product_id, 1)
+            sold += 1
+        except Exception as e:
+            if "Недостаточно товара" not in str(e):
+                raise
+            rejected += 1
+    results.put((sold, rejected))
+
+
+def run(workers, attempts, stock):
+    tmp_dir = tempfile.mkdtemp()
+    db_url = f"sqlite:///{os.path.join(tmp_dir, 'stress.db')}"
+    # Остаток меняют другие процессы, поэтому без кэша
+    db = DatabaseManager(db_url, cache_size=0)
+    product = db.add_product("Стресс-товар", ProductCategory.OTHER, 10.0, quantity=stock)
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker, args=(db_url, product.id, attempts, results))
+        for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    totals = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+        if p.exitcode != 0:
+            raise SystemExit(f"Процесс {p.pid} завершился с кодом {p.exitcode}")
+
+    sold = sum(t[0] for t in totals)
+    rejected = sum(t[1] for t in totals)
+    remaining = db.get_product_by_id(product.id).quantity
+
+    session = db.Session()
+    try:
+        recorded = session.query(Sale).filter(Sale.product_id == product.id).count()
+    finally:
+        session.close()
+
+    print(f"Продано: {sold}, отказов: {rejected}, остаток: {remaining}, записей продаж: {recorded}")
+    assert remaining >= 0, "Остаток ушел в минус"
+    assert remaining == stock - sold, "Остаток не совпадает с числом продаж"
+    assert recorded == sold, "Число записей продаж не совпадает с числом продаж"
+    if workers * attempts >= stock:
+        assert remaining == 0, "Товар не распродан до конца"
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=200)
+    args = parser.parse_args()
+    run(args.workers, args.attempts, args.stock)
+
+
+if __name__ == "__main__":
+    main()
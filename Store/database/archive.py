@@ -0,0 +1,60 @@
+import os
+from sqlalchemy import MetaData, Table, Column, Index, select, union_all
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased
+from database.models import Sale, Supply, StockMovement
+
+# Имя присоединенной архивной базы в SQL (archive.sales)
+ARCHIVE_SCHEMA = 'archive'
+
+# Продажи, поставки и движения остатков старше этого срока переносятся в архив
+ARCHIVE_AFTER_DAYS = 365
+
+archive_metadata = MetaData(schema=ARCHIVE_SCHEMA)
+
+
+def _archive_table(model, index=('date', 'product_id')):
+    """Копия таблицы модели в архивной базе: те же колонки и id, без
+    внешних ключей (товары и клиенты остаются в основной базе)"""
+    table = model.__table__
+    return Table(
+        table.name, archive_metadata,
+        *[Column(c.name, c.type, primary_key=c.primary_key) for c in table.columns],
+        Index(f'ix_{ARCHIVE_SCHEMA}_{table.name}_{"_".join(index)}', *index),
+    )
+
+
+archive_sales = _archive_table(Sale)
+archive_supplies = _archive_table(Supply)
+# Остаток на дату ищется по товару, как в ix_stock_movements_product_date
+archive_movements = _archive_table(StockMovement, index=('product_id', 'date'))
+
+# Модель оперативной таблицы -> её архивная копия
+ARCHIVE_TABLES = {Sale: archive_sales, Supply: archive_supplies, StockMovement: archive_movements}
+
+
+def archive_path_for(db_url):
+    """Файл архива рядом с основной базой: store.db -> store_archive.db.
+    Для базы в памяти архива нет."""
+    database = make_url(db_url).database
+    if not database or database == ':memory:':
+        return None
+    return os.path.splitext(database)[0] + '_archive.db'
+
+
+def combined(model, horizon):
+    """Сущность model поверх оперативной и архивной таблиц (UNION ALL).
+
+    Из архива берутся только строки раньше horizon: если перенос
+    прервался между записью в архив и удалением из основной базы,
+    строка не попадет в результат дважды. Условия запроса на дату
+    SQLite проталкивает в обе части объединения, поэтому индексы
+    по дате работают.
+    """
+    hot = model.__table__
+    cold = ARCHIVE_TABLES[model]
+    union = union_all(
+        select(hot),
+        select(*[cold.c[c.name] for c in hot.columns]).where(cold.c.date < horizon),
+    ).subquery(hot.name)
+    return aliased(model, union)
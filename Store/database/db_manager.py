@@ -1,175 +1,1372 @@
-from sqlalchemy import create_engine, func, desc, and_
+import logging
+import os
+import random
+import time
+from concurrent.futures import Future
+from sqlalchemy import (
+    func, desc, and_, update, insert, inspect, select, delete, literal, true, text, case, cast,
+    exists, type_coerce, bindparam, union_all, Table, MetaData, Column, Integer, String, DateTime, Text
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-from database.models import Base, Product, Customer, Sale, Supply, ProductCategory
+from datetime import datetime, timedelta
+from database.archive import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_SCHEMA, ARCHIVE_TABLES, archive_metadata, archive_path_for, combined
+)
+from database.cache import LRUCache
+from database.engine import create_store_engine
+from database.instrumentation import QueryInstrumentation, instrumented, metrics, SLOW_QUERY_MS
+from database.write_queue import WriteQueue, MAX_BATCH, MAX_DELAY
+from database.models import (
+    Base, Product, Customer, Sale, Supply, ProductCategory, DailyRollup, InventoryCheck,
+    StockMovement, StockSnapshot, StockSnapshotItem, ArchiveRun, Money, SCHEMA_VERSION, to_money
+)
 
 
+# Повторы записи при "database is locked" от SQLite
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05
+
+logger = logging.getLogger(__name__)
+
+# Сколько товаров и клиентов держать в кэше, если он включен
+# (cache_size=CACHE_SIZE). По умолчанию кэш выключен, см. DatabaseManager
+CACHE_SIZE = 4096
+
+# Размер страницы для постраничной загрузки таблиц интерфейса
+PAGE_SIZE = 200
+
+# Как часто снимать остатки всех товаров (ensure_stock_snapshot):
+# запрос остатков на дату читает снимок и движения не старше этого срока
+STOCK_SNAPSHOT_DAYS = 7
+
+# Записи, которые можно объединять в одну транзакцию (apply_writes)
+WRITE_OPERATIONS = {
+    'sale': '_write_sales',
+    'supply': '_write_supply',
+    'product': '_write_product',
+    'customer': '_write_customer',
+}
+
+# Пересчитанные остатки инвентаризации. Временная таблица живет в
+# соединении и в store.db не попадает, поэтому не входит в Base.metadata
+stock_counts = Table(
+    'stock_counts', MetaData(),
+    Column('product_id', Integer),
+    Column('barcode', String),
+    Column('actual', Integer, nullable=False),
+    prefixes=['TEMPORARY'],
+)
+
+# Прибавление к дневным итогам. Конструкция on_conflict_do_update диалекта
+# sqlite не кэшируется SQLAlchemy и компилировалась бы на каждую продажу,
+# поэтому оператор собран один раз текстом с типизированными параметрами
+ROLLUP_COLUMNS = ('sold_quantity', 'revenue', 'discount', 'supplied_quantity', 'supply_cost')
+rollup_upsert = text(
+    "INSERT INTO daily_rollups (day, product_id, {names}) VALUES (:day, :product_id, {params}) "
+    "ON CONFLICT (day, product_id) DO UPDATE SET {updates}".format(
+        names=", ".join(ROLLUP_COLUMNS),
+        params=", ".join(f":{name}" for name in ROLLUP_COLUMNS),
+        updates=", ".join(f"{name} = {name} + excluded.{name}" for name in ROLLUP_COLUMNS),
+    )
+).bindparams(*(
+    bindparam(column.name, type_=column.type)
+    for column in DailyRollup.__table__.columns
+))
+
+
+def _first(results):
+    return results[0]
+
+
+def is_locked_error(error):
+    """SQLite не смог получить блокировку на запись"""
+    return isinstance(error, OperationalError) and "database is locked" in str(error)
+
+
+@instrumented
 class DatabaseManager:
     """Менеджер базы данных магазина"""
 
-    def __init__(self, db_url="sqlite:///store.db"):
-        self.engine = create_engine(db_url)
+    def __init__(self, db_url="sqlite:///store.db", profile="performance",
+                 lock_retries=LOCK_RETRIES, lock_backoff=LOCK_BACKOFF,
+                 cache_size=0, catalog_snapshot=False,
+                 slow_query_ms=SLOW_QUERY_MS, archive_path=None):
+        self.lock_retries = lock_retries
+        self.lock_backoff = lock_backoff
+        # Архив старых продаж и поставок (archive_old_data), присоединяется
+        # к соединениям как схема archive, если файл уже создан
+        self.archive_path = archive_path or archive_path_for(db_url)
+        attach = {ARCHIVE_SCHEMA: self.archive_path} if self.archive_path else None
+        self.engine = create_store_engine(db_url, profile, attach=attach)
+        self.instrumentation = QueryInstrumentation(self.engine, slow_query_ms=slow_query_ms).install()
         self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self._listeners = []
+
+        # Кэш товаров и клиентов только для единственного писателя:
+        # он сбрасывается собственными методами записи менеджера и не
+        # видит записей других менеджеров и процессов (касс, сервера,
+        # бэк-офиса), поэтому цена из него может устареть. Включайте
+        # его (cache_size=CACHE_SIZE), только если этот менеджер -
+        # единственный, кто пишет в базу.
+        self.product_cache = LRUCache(cache_size)
+        self.customer_cache = LRUCache(cache_size)
+        self.catalog_snapshot = catalog_snapshot
+        self._catalog = {}
+        self.write_queue = None
         self.create_tables()
 
     def create_tables(self):
         """Создать таблицы в базе данных"""
+        existing = set(inspect(self.engine).get_table_names())
+        has_rollups = DailyRollup.__tablename__ in existing
+        has_ledger = StockMovement.__tablename__ in existing
+        with self.engine.connect() as conn:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if existing and version < 1:
+            self.migrate_money(existing)
+        if existing and version < 2:
+            self.migrate_autoincrement(existing)
         Base.metadata.create_all(self.engine)
+        if self.has_archive():
+            archive_metadata.create_all(self.engine)
+        self.ensure_indexes()
+        if version < SCHEMA_VERSION:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if not has_rollups:
+            # Старая база без дневных итогов: заполнить их по истории
+            self.rebuild_rollups()
+        if existing and not has_ledger:
+            # Старая база без журнала остатков: восстановить его по истории
+            self.rebuild_stock_ledger()
 
-    def add_product(self, name, category, price, quantity=0, min_stock=10,
-                    barcode=None, description=None):
-        """Добавить товар"""
+    def migrate_money(self, existing):
+        """Перевести денежные колонки старой базы из REAL в целые копейки.
+
+        SQLite не умеет менять тип колонки, поэтому каждая таблица с
+        деньгами пересоздается (_rebuild_table) с умножением денег на 100.
+        Все таблицы переводятся в одной транзакции.
+        """
+        with self.engine.connect() as conn:
+            try:
+                # Ссылки FOREIGN KEY в других таблицах не должны
+                # переписываться на временное имя при RENAME
+                conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+                for table in Base.metadata.sorted_tables:
+                    money = {c.name for c in table.columns if isinstance(c.type, Money)}
+                    if table.name not in existing or not money:
+                        continue
+                    self._rebuild_table(conn, table, lambda name: (
+                        f'CAST(ROUND("{name}" * 100) AS INTEGER)' if name in money else f'"{name}"'
+                    ))
+                    logger.info("Таблица %s переведена на копейки", table.name)
+                conn.exec_driver_sql("PRAGMA user_version = 1")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+
+    def migrate_autoincrement(self, existing):
+        """Включить AUTOINCREMENT у продаж, поставок и журнала остатков.
+
+        Без него SQLite отдает новой строке id на единицу больше
+        наибольшего в таблице, и после переноса последних строк в архив
+        их id достались бы новым продажам. Таблицы пересоздаются по
+        модели, а счетчик id поднимается выше id, уже лежащих в архиве.
+        """
+        tables = [model.__table__ for model in (Sale, Supply, StockMovement)]
+        with self.engine.connect() as conn:
+            try:
+                conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+                for table in tables:
+                    if table.name not in existing:
+                        continue
+                    sql = conn.exec_driver_sql(
+                        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+                    ).scalar()
+                    if 'AUTOINCREMENT' not in sql.upper():
+                        self._rebuild_table(conn, table)
+                        logger.info("Таблица %s пересоздана с AUTOINCREMENT", table.name)
+                    self._raise_id_floor(conn, table.name)
+                conn.exec_driver_sql("PRAGMA user_version = 2")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+
+    def _rebuild_table(self, conn, table, value=None):
+        """Пересоздать таблицу по модели, сохранив данные.
+
+        Старая таблица переименовывается, создается новая по модели,
+        строки копируются, старая удаляется. value(имя колонки) - SQL
+        выражение для переноса значения (по умолчанию сама колонка).
+        """
+        old = f"{table.name}__old"
+        indexes = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name = ? AND sql IS NOT NULL", (table.name,)
+        ).scalars().all()
+        for name in indexes:
+            conn.exec_driver_sql(f'DROP INDEX "{name}"')
+        conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old}"')
+        table.create(conn)
+        old_columns = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{old}")')}
+        columns = [c.name for c in table.columns if c.name in old_columns]
+        values = [value(name) if value else f'"{name}"' for name in columns]
+        names = ", ".join(f'"{name}"' for name in columns)
+        conn.exec_driver_sql(
+            f'INSERT INTO "{table.name}" ({names}) SELECT {", ".join(values)} FROM "{old}"'
+        )
+        conn.exec_driver_sql(f'DROP TABLE "{old}"')
+
+    def _raise_id_floor(self, conn, name):
+        """Поднять счетчик AUTOINCREMENT таблицы name выше id её строк в архиве"""
+        if not self.has_archive():
+            return
+        in_archive = conn.exec_driver_sql(
+            f"SELECT count(*) FROM {ARCHIVE_SCHEMA}.sqlite_master WHERE type = 'table' AND name = ?",
+            (name,)
+        ).scalar()
+        if not in_archive:
+            return
+        floor = conn.exec_driver_sql(f'SELECT max(id) FROM {ARCHIVE_SCHEMA}."{name}"').scalar()
+        if floor is None:
+            return
+        raised = conn.exec_driver_sql(
+            "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (floor, name)
+        ).rowcount
+        if not raised:
+            conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, floor))
+
+    def ensure_indexes(self):
+        """Досоздать индексы в уже существующей базе.
+
+        create_all не трогает существующие таблицы, поэтому в старых
+        файлах store.db индексы нужно добавлять отдельно.
+        """
+        # Список берется из sqlite_master: рефлексия SQLAlchemy не видит
+        # индексы по выражениям, и checkfirst пытался бы создать их снова
+        with self.engine.begin() as conn:
+            existing = set(conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            ).scalars())
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(conn)
+
+    def run_with_retry(self, operation, *args, **kwargs):
+        """Выполнить запись, повторяя её с экспоненциальной паузой,
+        пока база занята другим процессом"""
+        attempt = 0
+        while True:
+            try:
+                return operation(*args, **kwargs)
+            except OperationalError as e:
+                if not is_locked_error(e) or attempt >= self.lock_retries:
+                    raise e
+                time.sleep(self.lock_backoff * (2 ** attempt) * (1 + random.random()))
+                attempt += 1
+
+    def subscribe(self, listener):
+        """Подписаться на изменения данных.
+
+        После каждой успешной записи listener вызывается со словарем
+        {'products': {id, ...}, 'customers': ..., 'sales': ..., 'supplies': ...},
+        в котором есть только затронутые таблицы. Если запись изменила
+        остатки, в словаре есть и 'stock': {product_id: новый остаток}.
+        """
+        self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def publish_changes(self, stock=None, purchases=None, **changes):
+        """Обновить кэш и оповестить подписчиков.
+
+        Методы записи менеджера вызывают это сами; код, который пишет в
+        базу через Session напрямую (массовый импорт), вызывает после
+        фиксации транзакции.
+
+        stock ({product_id: новый остаток}) и purchases ({customer_id:
+        новая сумма покупок}) - изменения, которые можно внести в кэш на
+        месте: цена и скидка от продажи не меняются, и кэш остается
+        горячим. Остальные затронутые объекты из кэша удаляются.
+        """
+        stock = stock or {}
+        purchases = purchases or {}
+        changes = {kind: set(ids) for kind, ids in changes.items() if ids}
+        if stock:
+            changes.setdefault('products', set()).update(stock)
+        if purchases:
+            changes.setdefault('customers', set()).update(purchases)
+        if not changes:
+            return
+        self._patch_cache(self.product_cache, changes.get('products', ()), 'quantity', stock)
+        self._patch_cache(self.customer_cache, changes.get('customers', ()),
+                          'total_purchases', purchases)
+        if 'products' in changes:
+            self._catalog.pop('products', None)
+        if 'customers' in changes:
+            self._catalog.pop('customers', None)
+        if stock:
+            changes['stock'] = dict(stock)
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception:
+                # Запись уже зафиксирована, ошибка подписчика не должна её "отменять"
+                logger.exception("Ошибка обработчика изменений")
+
+    def _patch_cache(self, cache, ids, attribute, values):
+        stale = []
+        for object_id in ids:
+            obj = cache.peek(object_id)
+            if obj is not None and object_id in values:
+                setattr(obj, attribute, values[object_id])
+            else:
+                stale.append(object_id)
+        cache.invalidate(stale)
+
+    def _update_rollups(self, session, deltas):
+        """Прибавить значения к дневным итогам.
+
+        deltas - словарь {(day, product_id): {колонка: прирост}}.
+        """
+        if not deltas:
+            return
+        session.execute(rollup_upsert, [
+            dict({name: values.get(name, 0) for name in ROLLUP_COLUMNS}, day=day, product_id=product_id)
+            for (day, product_id), values in deltas.items()
+        ])
+
+    def rebuild_rollups(self):
+        """Пересчитать дневные итоги заново по таблицам sales и supplies
+        (вместе с архивом)"""
+        sale, supply = self.sales_source(), self.supplies_source()
         session = self.Session()
         try:
-            product = Product(
-                name=name,
-                category=category,
-                price=price,
-                quantity=quantity,
-                min_stock=min_stock,
-                barcode=barcode,
-                description=description
+            session.execute(delete(DailyRollup))
+            sale_day = func.date(sale.date)
+            sales = select(
+                sale_day, sale.product_id,
+                func.sum(sale.quantity), func.sum(sale.total),
+                func.sum(sale.price * sale.quantity - sale.total),
+                literal(0), literal(0)
+            ).group_by(sale_day, sale.product_id)
+            session.execute(DailyRollup.__table__.insert().from_select(
+                ['day', 'product_id', 'sold_quantity', 'revenue', 'discount',
+                 'supplied_quantity', 'supply_cost'],
+                sales
+            ))
+
+            # WHERE в SELECT нужен SQLite, чтобы не спутать ON CONFLICT с условием JOIN
+            supply_day = func.date(supply.date)
+            supplies = select(
+                supply_day, supply.product_id,
+                literal(0), literal(0), literal(0),
+                func.sum(supply.quantity), func.sum(supply.cost)
+            ).where(true()).group_by(supply_day, supply.product_id)
+            stmt = sqlite_insert(DailyRollup).from_select(
+                ['day', 'product_id', 'sold_quantity', 'revenue', 'discount',
+                 'supplied_quantity', 'supply_cost'],
+                supplies
             )
-            session.add(product)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[DailyRollup.day, DailyRollup.product_id],
+                set_={
+                    'supplied_quantity': stmt.excluded.supplied_quantity,
+                    'supply_cost': stmt.excluded.supply_cost,
+                }
+            )
+            session.execute(stmt)
             session.commit()
-            session.refresh(product)
-            return product
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
 
-    def get_all_products(self):
-        """Получить все товары"""
+    def has_archive(self):
+        return bool(self.archive_path) and os.path.exists(self.archive_path)
+
+    def archive_horizon(self):
+        """Граница архива: продажи и поставки раньше неё лежат в архиве.
+        None, если в архив еще ничего не переносилось."""
+        if not self.has_archive():
+            return None
         session = self.Session()
         try:
-            return session.query(Product).all()
+            return session.query(func.max(ArchiveRun.before)).scalar()
         finally:
             session.close()
 
-    def get_product_by_id(self, product_id):
+    def _source(self, model, start_date):
+        horizon = self.archive_horizon()
+        if horizon is None or (start_date is not None and start_date >= horizon):
+            return model
+        return combined(model, horizon)
+
+    def sales_source(self, start_date=None):
+        """Продажи для запроса с начала периода start_date (None - вся история).
+
+        Если период не заходит в архив, это сама модель Sale и запрос
+        читает только оперативную базу. Иначе - сущность с теми же
+        атрибутами поверх объединения основной и архивной таблиц.
+        """
+        return self._source(Sale, start_date)
+
+    def supplies_source(self, start_date=None):
+        """Поставки с начала периода start_date, см. sales_source"""
+        return self._source(Supply, start_date)
+
+    def movements_source(self, start_date=None):
+        """Движения остатков с начала периода start_date, см. sales_source"""
+        return self._source(StockMovement, start_date)
+
+    def archive_old_data(self, before=None, vacuum=False):
+        """Перенести продажи, поставки и движения остатков раньше before
+        в архивную базу.
+
+        По умолчанию переносится все старше ARCHIVE_AFTER_DAYS дней.
+        Дневные итоги и снимки остатков остаются в основной базе: отчеты
+        по итогам не меняются, а остаток на дату - это снимок плюс
+        движения после него, и в архив он заглядывает только для дат
+        раньше первого снимка или для снимков за границей архива.
+
+        Перенос идет двумя транзакциями: сначала копия в архив, затем
+        удаление из основной базы только тех строк, что лежат в архиве
+        в точности такими же, вместе с записью ArchiveRun. Если удаляется
+        меньше строк, чем подлежит переносу, вторая транзакция
+        откатывается с ошибкой. Сбой между ними оставляет лишь копию,
+        которую следующий запуск доделает.
+        vacuum=True после переноса сжимает файл основной базы.
+
+        Возвращает словарь: before, sales, supplies и stock_movements
+        (перенесено строк).
+        """
+        if not self.archive_path:
+            raise Exception("Архив доступен только для базы в файле")
+        before = before or datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        if not self.has_archive():
+            # Пустой файл - пустая база SQLite; новые соединения присоединят его
+            open(self.archive_path, 'a').close()
+            self.engine.dispose()
+        archive_metadata.create_all(self.engine)
+
+        self.run_with_retry(self._copy_to_archive, before)
+        moved = self.run_with_retry(self._delete_archived, before)
+        if vacuum:
+            connection = self.engine.raw_connection()
+            try:
+                connection.execute("VACUUM main")
+            finally:
+                connection.close()
+        return moved
+
+    def _copy_to_archive(self, before):
         session = self.Session()
         try:
-            return session.query(Product).get(product_id)
+            for model, cold in ARCHIVE_TABLES.items():
+                hot = model.__table__
+                names = [c.name for c in hot.columns]
+                session.execute(
+                    cold.insert().prefix_with("OR IGNORE").from_select(
+                        names, select(hot).where(hot.c.date < before)
+                    )
+                )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
         finally:
             session.close()
 
-    def get_customer_by_id(self, customer_id):
+    def _delete_archived(self, before):
         session = self.Session()
         try:
-            return session.query(Customer).get(customer_id)
+            moved = {'before': before}
+            for model, cold in ARCHIVE_TABLES.items():
+                hot = model.__table__
+                due = hot.c.date < before
+                # Удаляется только строка, копия которой в архиве совпадает
+                # с ней целиком, а не одним id. Псевдоним нужен, чтобы
+                # одноименная архивная таблица не заслонила основную
+                archived = cold.alias('archived')
+                copied = exists().where(*[
+                    archived.c[c.name] == c if c.primary_key else archived.c[c.name].is_not_distinct_from(c)
+                    for c in hot.columns
+                ])
+                pending = session.execute(select(func.count()).select_from(hot).where(due)).scalar()
+                deleted = session.execute(delete(hot).where(due, copied)).rowcount
+                if deleted != pending:
+                    raise Exception(
+                        f"Перенос в архив отменен: {pending - deleted} из {pending} строк "
+                        f"{hot.name} не совпадают со своей копией в архиве"
+                    )
+                moved[hot.name] = deleted
+            session.add(ArchiveRun(before=before, sales=moved['sales'], supplies=moved['supplies']))
+            session.commit()
+            logger.info("В архив перенесено продаж: %s, поставок: %s, движений остатков: %s",
+                        moved['sales'], moved['supplies'], moved['stock_movements'])
+            return moved
+        except Exception as e:
+            session.rollback()
+            raise e
         finally:
             session.close()
 
-    def add_customer(self, name, phone, email, discount=0.0):
+    def _record_movements(self, session, movements):
+        """Добавить строки в журнал движений остатков.
+
+        movements - список словарей с ключами product_id, date, kind,
+        ref_id, change и quantity (остаток после движения).
+        """
+        if movements:
+            session.execute(insert(StockMovement), movements)
+
+    def rebuild_stock_ledger(self, snapshot_days=STOCK_SNAPSHOT_DAYS):
+        """Восстановить журнал движений остатков по истории.
+
+        Движения берутся из sales, supplies (вместе с архивом) и
+        inventory_checks. Разница
+        между текущим остатком и суммой движений записывается начальным
+        остатком ('opening') на дату создания товара, так что журнал
+        всегда сходится с Product.quantity. Затем по журналу строятся
+        снимки остатков на каждые snapshot_days дней истории, а движения
+        раньше границы архива переносятся в архив, как при archive_old_data.
+        """
+        horizon = self.archive_horizon()
         session = self.Session()
         try:
-            customer = Customer(
-                name=name,
-                phone=phone,
-                email=email,
-                discount=discount
+            session.execute(delete(StockSnapshotItem))
+            session.execute(delete(StockSnapshot))
+            session.execute(delete(StockMovement))
+            if self.has_archive():
+                session.execute(delete(ARCHIVE_TABLES[StockMovement]))
+
+            sale, supply = self.sales_source(), self.supplies_source()
+            events = union_all(
+                select(sale.product_id, sale.date, literal('sale').label('kind'),
+                       sale.id.label('ref_id'), (-sale.quantity).label('change')),
+                select(supply.product_id, supply.date, literal('supply'), supply.id, supply.quantity),
+                select(InventoryCheck.product_id, InventoryCheck.date, literal('stock_take'),
+                       InventoryCheck.id, InventoryCheck.difference).where(InventoryCheck.difference != 0),
+            ).subquery()
+            totals = select(
+                events.c.product_id,
+                func.sum(events.c.change).label('change'),
+                func.min(events.c.date).label('first_date'),
+            ).group_by(events.c.product_id).subquery()
+            now = literal(datetime.now(), DateTime)
+            # Начальный остаток не позже первого движения товара
+            opening_date = func.min(
+                func.coalesce(Product.created_at, totals.c.first_date, now),
+                func.coalesce(totals.c.first_date, Product.created_at, now),
             )
-            session.add(customer)
+            openings = select(
+                Product.id.label('product_id'), opening_date.label('date'),
+                literal('opening').label('kind'), literal(None, Integer).label('ref_id'),
+                (func.coalesce(Product.quantity, 0) - func.coalesce(totals.c.change, 0)).label('change'),
+                literal(0).label('ord'),
+            ).outerjoin(totals, totals.c.product_id == Product.id)
+
+            movements = union_all(openings, select(events, literal(1))).subquery()
+            order = (movements.c.date, movements.c.ord, movements.c.kind, movements.c.ref_id)
+            session.execute(insert(StockMovement).from_select(
+                ['product_id', 'date', 'kind', 'ref_id', 'change', 'quantity'],
+                select(
+                    movements.c.product_id, movements.c.date, movements.c.kind, movements.c.ref_id,
+                    movements.c.change,
+                    func.sum(movements.c.change).over(
+                        partition_by=movements.c.product_id, order_by=order, rows=(None, 0)
+                    ),
+                ).order_by(*order)
+            ))
+
+            first = session.query(func.min(StockMovement.date)).scalar()
+            if first is not None:
+                taken_at = datetime.combine(first.date(), datetime.min.time())
+                while True:
+                    taken_at += timedelta(days=snapshot_days)
+                    if taken_at > datetime.now():
+                        break
+                    last_id = session.query(func.max(StockMovement.id)).filter(
+                        StockMovement.date < taken_at
+                    ).scalar() or 0
+                    self._write_snapshot(session, taken_at, last_id)
+            if horizon is not None:
+                hot, cold = StockMovement.__table__, ARCHIVE_TABLES[StockMovement]
+                session.execute(cold.insert().from_select(
+                    [c.name for c in hot.columns], select(hot).where(hot.c.date < horizon)
+                ))
+                session.execute(delete(hot).where(hot.c.date < horizon))
             session.commit()
-            session.refresh(customer)
-            return customer
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
 
-    def get_all_customers(self):
+    def _write_snapshot(self, session, taken_at, last_movement_id):
+        """Снимок остатков на движение last_movement_id: предыдущий
+        снимок плюс последние движения товаров после него"""
+        previous = session.query(StockSnapshot).order_by(desc(StockSnapshot.id)).first()
+        previous_id = previous.id if previous else None
+        previous_last = previous.last_movement_id if previous else 0
+        # Все движения могли уйти в архив: снимок не отступает назад
+        last_movement_id = max(last_movement_id, previous_last)
+        snapshot = StockSnapshot(taken_at=taken_at, last_movement_id=last_movement_id)
+        session.add(snapshot)
+        session.flush()
+
+        move = self.movements_source(previous.taken_at if previous else None)
+        in_range = and_(move.id > previous_last, move.id <= last_movement_id)
+        latest = select(func.max(move.id)).where(in_range).group_by(move.product_id)
+        moved = select(move.product_id).where(in_range)
+        session.execute(insert(StockSnapshotItem).from_select(
+            ['snapshot_id', 'product_id', 'quantity'],
+            union_all(
+                select(literal(snapshot.id), move.product_id, move.quantity)
+                .where(move.id.in_(latest)),
+                select(literal(snapshot.id), StockSnapshotItem.product_id, StockSnapshotItem.quantity)
+                .where(StockSnapshotItem.snapshot_id == previous_id,
+                       StockSnapshotItem.product_id.not_in(moved)),
+            )
+        ))
+        return snapshot
+
+    def take_stock_snapshot(self):
+        """Снять остатки всех товаров по текущему состоянию журнала"""
+        return self.run_with_retry(self._take_stock_snapshot)
+
+    def _take_stock_snapshot(self):
         session = self.Session()
         try:
-            return session.query(Customer).all()
+            last_id = session.query(func.max(StockMovement.id)).scalar() or 0
+            snapshot = self._write_snapshot(session, datetime.now(), last_id)
+            session.commit()
+            return snapshot
+        except Exception as e:
+            session.rollback()
+            raise e
         finally:
             session.close()
 
-    def record_sale(self, product_id, quantity, customer_id=None):
-        """Записать продажу"""
+    def ensure_stock_snapshot(self, max_age_days=STOCK_SNAPSHOT_DAYS):
+        """Снять остатки, если последний снимок старше max_age_days.
+
+        Вызывается периодически (при запуске приложения, сервером);
+        возвращает новый снимок или None.
+        """
+        session = self.Session()
+        try:
+            latest = session.query(func.max(StockSnapshot.taken_at)).scalar()
+        finally:
+            session.close()
+        if latest is not None and datetime.now() - latest < timedelta(days=max_age_days):
+            return None
+        return self.take_stock_snapshot()
+
+    def _snapshot_before(self, session, when):
+        """Последний снимок остатков не позже when (None - снимков нет)"""
+        return session.query(StockSnapshot).filter(
+            StockSnapshot.taken_at <= when
+        ).order_by(desc(StockSnapshot.taken_at), desc(StockSnapshot.id)).first()
+
+    def get_stock_at(self, product_id, when):
+        """Остаток товара на момент when по журналу движений.
+
+        Читается последний снимок до when и движения товара после него;
+        без снимка - последнее движение до when (с архивом).
+        """
+        session = self.Session()
+        try:
+            snapshot = self._snapshot_before(session, when)
+            move = self.movements_source(snapshot.taken_at if snapshot else None)
+            query = session.query(move.quantity).filter(move.product_id == product_id, move.date <= when)
+            if snapshot is not None:
+                query = query.filter(move.id > snapshot.last_movement_id)
+            quantity = query.order_by(desc(move.date), desc(move.id)).limit(1).scalar()
+            if quantity is None and snapshot is not None:
+                quantity = session.query(StockSnapshotItem.quantity).filter(
+                    StockSnapshotItem.snapshot_id == snapshot.id,
+                    StockSnapshotItem.product_id == product_id
+                ).scalar()
+            return quantity or 0
+        finally:
+            session.close()
+
+    def get_stock_levels_at(self, when):
+        """Остатки всех товаров на момент when: {product_id: количество}.
+
+        Читается последний снимок до when и только движения после него.
+        Товары, которых на тот момент еще не было, в словарь не входят.
+        """
+        session = self.Session()
+        try:
+            snapshot = self._snapshot_before(session, when)
+            levels = {}
+            last_id = 0
+            if snapshot is not None:
+                levels = dict(session.query(StockSnapshotItem.product_id, StockSnapshotItem.quantity)
+                              .filter(StockSnapshotItem.snapshot_id == snapshot.id).all())
+                last_id = snapshot.last_movement_id
+            move = self.movements_source(snapshot.taken_at if snapshot else None)
+            latest = select(func.max(move.id)).where(
+                move.id > last_id, move.date <= when
+            ).group_by(move.product_id)
+            levels.update(session.query(move.product_id, move.quantity).filter(
+                move.id.in_(latest)
+            ).all())
+            return levels
+        finally:
+            session.close()
+
+    def get_stock_history(self, product_id, start_date, end_date):
+        """Остаток товара во времени: [(момент, остаток), ...].
+
+        Первая точка - остаток на start_date, дальше по точке на каждое
+        движение до end_date.
+        """
+        move = self.movements_source(start_date)
+        session = self.Session()
+        try:
+            moves = session.query(move.date, move.quantity).filter(
+                move.product_id == product_id,
+                move.date > start_date, move.date <= end_date
+            ).order_by(move.date, move.id).all()
+        finally:
+            session.close()
+        return [(start_date, self.get_stock_at(product_id, start_date))] + [tuple(m) for m in moves]
+
+    def _write(self, write, *args):
+        """Выполнить write(session, *args) одной транзакцией.
+
+        write возвращает (результат, изменения для publish_changes);
+        подписчики оповещаются после фиксации.
+        """
+        session = self.Session()
+        try:
+            result, changes = write(session, *args)
+            session.commit()
+            self.publish_changes(**changes)
+            return result
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def apply_writes(self, operations):
+        """Выполнить пачку записей одной транзакцией (group commit).
+
+        operations - список пар (вид, аргументы), вид из WRITE_OPERATIONS:
+        ('sale', (lines,)), ('supply', (supplier, product_id, quantity, cost)),
+        ('product', (...)), ('customer', (...)). Каждая запись идет в своей
+        точке сохранения: ошибка (например, нехватка товара) откатывает
+        только её. Возвращает список той же длины с результатами или
+        исключениями; фиксация и оповещение - одни на всю пачку.
+        """
+        operations = list(operations)
+        if not operations:
+            return []
+        return self.run_with_retry(self._apply_writes, operations)
+
+    def _apply_writes(self, operations):
         session = self.Session()
         try:
-            product = session.query(Product).get(product_id)
-            if not product:
+            results = []
+            merged = {}
+            for kind, args in operations:
+                try:
+                    with session.begin_nested():
+                        result, changes = getattr(self, WRITE_OPERATIONS[kind])(session, *args)
+                except OperationalError as e:
+                    if is_locked_error(e):
+                        raise
+                    results.append(e)
+                    continue
+                except Exception as e:
+                    results.append(e)
+                    continue
+                results.append(result)
+                for name, value in changes.items():
+                    if isinstance(value, dict):
+                        merged.setdefault(name, {}).update(value)
+                    else:
+                        merged.setdefault(name, []).extend(value)
+            session.commit()
+            self.publish_changes(**merged)
+            return results
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def add_product(self, name, category, price, quantity=0, min_stock=10,
+                    barcode=None, description=None):
+        """Добавить товар"""
+        return self._write(self._write_product, name, category, price, quantity,
+                           min_stock, barcode, description)
+
+    def _write_product(self, session, name, category, price, quantity=0, min_stock=10,
+                       barcode=None, description=None):
+        product = Product(
+            name=name,
+            category=category,
+            price=price,
+            quantity=quantity,
+            min_stock=min_stock,
+            barcode=barcode,
+            description=description
+        )
+        session.add(product)
+        session.flush()
+        self._record_movements(session, [{
+            'product_id': product.id, 'date': product.created_at, 'kind': 'opening',
+            'ref_id': None, 'change': product.quantity, 'quantity': product.quantity,
+        }])
+        return product, {'products': [product.id]}
+
+    def cache_stats(self):
+        """Счетчики попаданий и промахов кэша товаров и клиентов"""
+        return {
+            'products': self.product_cache.stats(),
+            'customers': self.customer_cache.stats(),
+        }
+
+    def diagnostics(self):
+        """Снимок метрик: время запросов и методов, медленные запросы, кэш, пул
+        и очередь групповой фиксации"""
+        snapshot = metrics.snapshot()
+        snapshot['cache'] = self.cache_stats()
+        snapshot['pool'] = self.engine.pool.status()
+        snapshot['slow_query_ms'] = self.instrumentation.slow_query_ms
+        if self.write_queue is not None:
+            snapshot['write_queue'] = dict(self.write_queue.stats, pending=self.write_queue.pending())
+        return snapshot
+
+    def _get_cached(self, session, model, cache, ids):
+        """Объекты по id: из кэша, недостающие - одним запросом IN.
+
+        Возвращенные объекты общие для всех вызовов, изменять их нельзя.
+        """
+        found = {}
+        missing = []
+        for object_id in ids:
+            obj = cache.get(object_id)
+            if obj is None:
+                missing.append(object_id)
+            else:
+                found[object_id] = obj
+        if missing:
+            for obj in session.query(model).filter(model.id.in_(missing)).all():
+                # Отсоединяем сразу, чтобы откат этой сессии не сбросил
+                # атрибуты объекта, уже лежащего в кэше
+                session.expunge(obj)
+                cache.put(obj.id, obj)
+                found[obj.id] = obj
+        return found
+
+    def _get_one_cached(self, model, cache, object_id):
+        session = self.Session()
+        try:
+            return self._get_cached(session, model, cache, [object_id]).get(object_id)
+        finally:
+            session.close()
+
+    def _get_all(self, model, kind):
+        if self.catalog_snapshot and kind in self._catalog:
+            return self._catalog[kind]
+        session = self.Session()
+        try:
+            rows = session.query(model).all()
+        finally:
+            session.close()
+        if self.catalog_snapshot:
+            self._catalog[kind] = rows
+        return rows
+
+    def get_all_products(self):
+        """Получить все товары"""
+        return self._get_all(Product, 'products')
+
+    def get_product_by_id(self, product_id):
+        return self._get_one_cached(Product, self.product_cache, product_id)
+
+    def get_customer_by_id(self, customer_id):
+        return self._get_one_cached(Customer, self.customer_cache, customer_id)
+
+    def add_customer(self, name, phone, email, discount=0.0):
+        return self._write(self._write_customer, name, phone, email, discount)
+
+    def _write_customer(self, session, name, phone, email, discount=0.0):
+        customer = Customer(
+            name=name,
+            phone=phone,
+            email=email,
+            discount=discount
+        )
+        session.add(customer)
+        session.flush()
+        return customer, {'customers': [customer.id]}
+
+    def get_all_customers(self):
+        return self._get_all(Customer, 'customers')
+
+    def start_group_commit(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        """Включить групповую фиксацию продаж и поставок.
+
+        После этого record_sale, record_sales и add_supply ставят запись
+        в WriteQueue и ждут фиксации её пачки, а submit_sale и
+        submit_supply сразу возвращают Future. Полезно, когда пишут
+        несколько потоков: синхронизация с диском одна на пачку.
+        """
+        if self.write_queue is None or not self.write_queue.running:
+            self.write_queue = WriteQueue(self, max_batch, max_delay).start()
+        return self.write_queue
+
+    def stop_group_commit(self):
+        """Зафиксировать принятые записи и вернуться к записи по одной"""
+        if self.write_queue is not None:
+            self.write_queue.stop()
+            self.write_queue = None
+
+    def _submit(self, kind, args, convert=None):
+        """Future с результатом записи: через очередь, если она включена,
+        иначе запись выполняется сразу"""
+        write_queue = self.write_queue
+        # Из подписчика (поток очереди) ждать свою же очередь нельзя
+        if write_queue is not None and write_queue.running and not write_queue.in_committer():
+            return write_queue.submit(kind, args, convert)
+        future = Future()
+        try:
+            result = self.run_with_retry(self._write, getattr(self, WRITE_OPERATIONS[kind]), *args)
+            future.set_result(convert(result) if convert else result)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit_sale(self, product_id, quantity, customer_id=None):
+        """Поставить продажу в очередь записи, вернуть Future с Sale"""
+        return self._submit('sale', ([(product_id, quantity, customer_id)],), _first)
+
+    def submit_sales(self, lines):
+        """Поставить корзину в очередь записи, вернуть Future со списком Sale"""
+        return self._submit('sale', (list(lines),))
+
+    def submit_supply(self, supplier, product_id, quantity, cost):
+        """Поставить поставку в очередь записи, вернуть Future с Supply"""
+        return self._submit('supply', (supplier, product_id, quantity, cost))
+
+    def record_sale(self, product_id, quantity, customer_id=None):
+        """Записать продажу"""
+        return self.record_sales([(product_id, quantity, customer_id)])[0]
+
+    def record_sales(self, lines):
+        """Записать корзину продаж одной транзакцией.
+
+        lines - список кортежей (product_id, quantity, customer_id).
+        Остатки проверяются для всей корзины сразу: если хотя бы одной
+        позиции не хватает, не записывается ничего. Количество - целое
+        больше нуля, иначе ValueError и корзина тоже не записывается.
+        """
+        lines = list(lines)
+        if not lines:
+            return []
+        return self.submit_sales(lines).result()
+
+    def _write_sales(self, session, lines):
+        product_ids = {line[0] for line in lines}
+        customer_ids = {line[2] for line in lines if line[2]}
+
+        # Цена и скидка берутся из кэша; остаток проверяет условный UPDATE ниже
+        products = self._get_cached(session, Product, self.product_cache, product_ids)
+        customers = {}
+        if customer_ids:
+            customers = self._get_cached(session, Customer, self.customer_cache, customer_ids)
+
+        requested = {}
+        for product_id, quantity, _ in lines:
+            # Отрицательное количество вернуло бы товар на склад через условный UPDATE
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise ValueError(f"Некорректное количество: {quantity!r}")
+            if product_id not in products:
                 raise Exception("Товар не найден")
-            if product.quantity < quantity:
-                raise Exception(f"Недостаточно товара. В наличии: {product.quantity}")
+            requested[product_id] = requested.get(product_id, 0) + quantity
 
-            customer = None
-            if customer_id:
-                customer = session.query(Customer).get(customer_id)
+        # Остаток проверяется и уменьшается одним условным UPDATE:
+        # параллельная касса не может продать тот же товар между
+        # проверкой и записью.
+        stock = {}
+        for product_id, quantity in requested.items():
+            remaining = session.execute(
+                update(Product)
+                .where(Product.id == product_id, Product.quantity >= quantity)
+                .values(quantity=Product.quantity - quantity)
+                .returning(Product.quantity)
+                .execution_options(synchronize_session=False)
+            ).scalar()
+            if remaining is None:
+                in_stock = session.query(Product.quantity).filter(
+                    Product.id == product_id
+                ).scalar()
+                raise Exception(
+                    f"Недостаточно товара {products[product_id].name}. В наличии: {in_stock}"
+                )
+            stock[product_id] = remaining
+
+        now = datetime.now()
+        sales = []
+        purchases = {}
+        rollups = {}
+        for product_id, quantity, customer_id in lines:
+            product = products[product_id]
+            customer = customers.get(customer_id) if customer_id else None
 
             total = product.price * quantity
             if customer and customer.discount > 0:
-                total = total * (1 - customer.discount / 100)
+                total = to_money(total * (100 - to_money(customer.discount)) / 100)
 
-            sale = Sale(
+            sales.append(Sale(
                 product_id=product_id,
                 customer_id=customer_id,
                 quantity=quantity,
                 price=product.price,
                 total=total,
-                date=datetime.now()
-            )
+                date=now
+            ))
+            if customer:
+                purchases[customer.id] = purchases.get(customer.id, 0) + total
 
-            product.quantity -= quantity
+            rollup = rollups.setdefault((now.date(), product_id), {})
+            rollup['sold_quantity'] = rollup.get('sold_quantity', 0) + quantity
+            rollup['revenue'] = rollup.get('revenue', 0) + total
+            rollup['discount'] = rollup.get('discount', 0) + product.price * quantity - total
 
-            if customer:
-                customer.total_purchases += total
+        customer_totals = {}
+        for customer_id, total in purchases.items():
+            customer_totals[customer_id] = session.execute(
+                update(Customer)
+                .where(Customer.id == customer_id)
+                .values(total_purchases=Customer.total_purchases + total)
+                .returning(Customer.total_purchases)
+                .execution_options(synchronize_session=False)
+            ).scalar()
+
+        self._update_rollups(session, rollups)
+        session.add_all(sales)
+        session.flush()
 
-            session.add(sale)
+        # Остаток после каждой строки: с конца корзины назад от итогового
+        after = dict(stock)
+        movements = []
+        for sale in reversed(sales):
+            movements.append({
+                'product_id': sale.product_id, 'date': now, 'kind': 'sale',
+                'ref_id': sale.id, 'change': -sale.quantity, 'quantity': after[sale.product_id],
+            })
+            after[sale.product_id] += sale.quantity
+        self._record_movements(session, movements[::-1])
+        return sales, {
+            'sales': [sale.id for sale in sales],
+            'stock': stock,
+            'purchases': customer_totals,
+        }
+
+    def add_supply(self, supplier, product_id, quantity, cost):
+        return self.submit_supply(supplier, product_id, quantity, cost).result()
+
+    def _write_supply(self, session, supplier, product_id, quantity, cost):
+        supply = Supply(
+            supplier=supplier,
+            product_id=product_id,
+            quantity=quantity,
+            cost=cost,
+            date=datetime.now()
+        )
+
+        stock = {}
+        remaining = session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(quantity=Product.quantity + quantity)
+            .returning(Product.quantity)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if remaining is not None:
+            stock[product_id] = remaining
+            self._update_rollups(session, {
+                (supply.date.date(), product_id): {
+                    'supplied_quantity': quantity,
+                    'supply_cost': cost,
+                }
+            })
+
+        session.add(supply)
+        session.flush()
+        if remaining is not None:
+            self._record_movements(session, [{
+                'product_id': product_id, 'date': supply.date, 'kind': 'supply',
+                'ref_id': supply.id, 'change': quantity, 'quantity': remaining,
+            }])
+        return supply, {'supplies': [supply.id], 'stock': stock}
+
+    def record_stock_take(self, counts, checked_by=None, notes=None):
+        """Провести инвентаризацию по пересчитанным остаткам.
+
+        counts - словарь {товар: фактическое количество}, где товар - id
+        (int) или штрихкод (str). Все расчеты идут одним проходом в SQL
+        через временную таблицу: для каждого товара пишется строка
+        InventoryCheck (ожидалось, факт, разница), затем остатки
+        приводятся к факту. Все в одной транзакции. Если один товар
+        указан несколько раз (по id и по штрихкоду), инвентаризация не
+        проводится: ValueError.
+
+        Возвращает словарь: counted, changed, shortage и surplus (штук),
+        shortage_value (Decimal) и unknown - ключи, которых нет в базе.
+        """
+        return self.run_with_retry(self._record_stock_take, counts, checked_by, notes)
+
+    def _record_stock_take(self, counts, checked_by, notes):
+        session = self.Session()
+        try:
+            if self._has_stock_counts(session):
+                session.execute(stock_counts.delete())
+            else:
+                stock_counts.create(session.connection())
+            rows = [
+                {'product_id': key, 'barcode': None, 'actual': actual} if isinstance(key, int)
+                else {'product_id': None, 'barcode': str(key).strip(), 'actual': actual}
+                for key, actual in counts.items()
+            ]
+            if rows:
+                session.execute(stock_counts.insert(), rows)
+            session.execute(
+                update(stock_counts)
+                .where(stock_counts.c.product_id.is_(None))
+                .values(product_id=select(Product.id).where(
+                    Product.barcode == stock_counts.c.barcode
+                ).scalar_subquery())
+            )
+            # Один товар и по id, и по штрихкоду: какой из пересчетов верен, неизвестно
+            duplicates = session.execute(
+                select(stock_counts.c.product_id)
+                .where(stock_counts.c.product_id.is_not(None))
+                .group_by(stock_counts.c.product_id)
+                .having(func.count() > 1)
+                .order_by(stock_counts.c.product_id)
+            ).scalars().all()
+            if duplicates:
+                raise ValueError(
+                    "Товары указаны в пересчете несколько раз (по id и по штрихкоду): "
+                    + ", ".join(map(str, duplicates))
+                )
+            known = stock_counts.c.product_id == Product.id
+            unknown = session.execute(
+                select(func.coalesce(stock_counts.c.barcode, cast(stock_counts.c.product_id, String)))
+                .where(~exists().where(known))
+            ).scalars().all()
+
+            now = datetime.now()
+            last_check = session.query(func.max(InventoryCheck.id)).scalar() or 0
+            difference = stock_counts.c.actual - Product.quantity
+            session.execute(InventoryCheck.__table__.insert().from_select(
+                ['product_id', 'expected_quantity', 'actual_quantity', 'difference',
+                 'checked_by', 'date', 'notes'],
+                select(
+                    Product.id, Product.quantity, stock_counts.c.actual, difference,
+                    literal(checked_by, String), literal(now, DateTime), literal(notes, Text)
+                ).where(known)
+            ))
+            totals = session.execute(
+                select(
+                    func.count(),
+                    func.coalesce(func.sum(case((difference != 0, 1), else_=0)), 0),
+                    func.coalesce(func.sum(case((difference < 0, -difference), else_=0)), 0),
+                    func.coalesce(func.sum(case((difference > 0, difference), else_=0)), 0),
+                    type_coerce(func.coalesce(
+                        func.sum(case((difference < 0, -difference * Product.price), else_=0)), 0
+                    ), Money),
+                ).where(known)
+            ).one()
+            stock = dict(session.execute(
+                update(Product)
+                .where(known, Product.quantity != stock_counts.c.actual)
+                .values(quantity=stock_counts.c.actual)
+                .returning(Product.id, Product.quantity)
+                .execution_options(synchronize_session=False)
+            ).all())
+            session.execute(insert(StockMovement).from_select(
+                ['product_id', 'date', 'kind', 'ref_id', 'change', 'quantity'],
+                select(
+                    InventoryCheck.product_id, InventoryCheck.date, literal('stock_take'),
+                    InventoryCheck.id, InventoryCheck.difference, InventoryCheck.actual_quantity
+                ).where(InventoryCheck.id > last_check, InventoryCheck.difference != 0)
+                .order_by(InventoryCheck.id)
+            ))
+            session.execute(stock_counts.delete())
             session.commit()
-            session.refresh(sale)
-            return sale
+            self.publish_changes(stock=stock)
+            return {
+                'counted': totals[0],
+                'changed': totals[1],
+                'shortage': totals[2],
+                'surplus': totals[3],
+                'shortage_value': totals[4],
+                'unknown': unknown,
+                'date': now,
+            }
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
 
-    def add_supply(self, supplier, product_id, quantity, cost):
+    def _has_stock_counts(self, session):
+        return session.execute(text(
+            "SELECT 1 FROM sqlite_temp_master WHERE type = 'table' AND name = 'stock_counts'"
+        )).first() is not None
+
+    def _product_rows(self, session):
+        return session.query(
+            Product.id, Product.name, Product.category, Product.price,
+            Product.quantity, Product.min_stock
+        )
+
+    def _customer_rows(self, session):
+        return session.query(
+            Customer.id, Customer.name, Customer.phone, Customer.email, Customer.discount
+        )
+
+    def _sale_rows(self, session):
+        # Названия товара и клиента берутся JOIN-ом в том же запросе
+        return session.query(
+            Sale.id, Sale.date, Product.name.label('product_name'), Sale.quantity,
+            Sale.total, Customer.name.label('customer_name')
+        ).outerjoin(Product, Sale.product_id == Product.id).outerjoin(
+            Customer, Sale.customer_id == Customer.id
+        )
+
+    def _supply_rows(self, session):
+        return session.query(
+            Supply.id, Supply.date, Supply.supplier,
+            Product.name.label('product_name'), Supply.quantity, Supply.cost
+        ).outerjoin(Product, Supply.product_id == Product.id)
+
+    def get_products_page(self, after_id=None, limit=PAGE_SIZE):
+        """Страница товаров по возрастанию id (keyset-пагинация)"""
         session = self.Session()
         try:
-            supply = Supply(
-                supplier=supplier,
-                product_id=product_id,
-                quantity=quantity,
-                cost=cost,
-                date=datetime.now()
-            )
+            query = self._product_rows(session)
+            if after_id is not None:
+                query = query.filter(Product.id > after_id)
+            return query.order_by(Product.id).limit(limit).all()
+        finally:
+            session.close()
 
-            product = session.query(Product).get(product_id)
-            if product:
-                product.quantity += quantity
+    def get_customers_page(self, after_id=None, limit=PAGE_SIZE):
+        """Страница клиентов по возрастанию id"""
+        session = self.Session()
+        try:
+            query = self._customer_rows(session)
+            if after_id is not None:
+                query = query.filter(Customer.id > after_id)
+            return query.order_by(Customer.id).limit(limit).all()
+        finally:
+            session.close()
 
-            session.add(supply)
-            session.commit()
-            session.refresh(supply)
-            return supply
-        except Exception as e:
-            session.rollback()
-            raise e
+    def get_sales_page(self, before_id=None, limit=PAGE_SIZE):
+        """Страница истории продаж, самые новые сначала"""
+        session = self.Session()
+        try:
+            query = self._sale_rows(session)
+            if before_id is not None:
+                query = query.filter(Sale.id < before_id)
+            return query.order_by(desc(Sale.id)).limit(limit).all()
+        finally:
+            session.close()
+
+    def get_supplies_page(self, before_id=None, limit=PAGE_SIZE):
+        """Страница истории поставок, самые новые сначала"""
+        session = self.Session()
+        try:
+            query = self._supply_rows(session)
+            if before_id is not None:
+                query = query.filter(Supply.id < before_id)
+            return query.order_by(desc(Supply.id)).limit(limit).all()
+        finally:
+            session.close()
+
+    def get_product_search_rows(self, ids=None):
+        """Строки (id, name, barcode, quantity) для индекса поиска товаров"""
+        session = self.Session()
+        try:
+            query = session.query(Product.id, Product.name, Product.barcode, Product.quantity)
+            if ids is not None:
+                query = query.filter(Product.id.in_(ids))
+            return query.all()
         finally:
             session.close()
 
+    def find_product_id_by_barcode(self, barcode):
+        """id товара по штрихкоду (по уникальному индексу) или None"""
+        session = self.Session()
+        try:
+            return session.query(Product.id).filter(Product.barcode == barcode).scalar()
+        finally:
+            session.close()
+
+    def _rows_by_ids(self, rows_query, id_column, ids):
+        session = self.Session()
+        try:
+            return rows_query(session).filter(id_column.in_(ids)).all()
+        finally:
+            session.close()
+
+    def get_product_rows(self, ids):
+        """Строки товаров в формате get_products_page для выбранных id"""
+        return self._rows_by_ids(self._product_rows, Product.id, ids)
+
+    def get_customer_rows(self, ids):
+        return self._rows_by_ids(self._customer_rows, Customer.id, ids)
+
+    def get_sale_rows(self, ids):
+        return self._rows_by_ids(self._sale_rows, Sale.id, ids)
+
+    def get_supply_rows(self, ids):
+        return self._rows_by_ids(self._supply_rows, Supply.id, ids)
+
     def get_low_stock_products(self):
         session = self.Session()
         try:
+            # Условие записано через разность, чтобы использовать
+            # индекс ix_products_stock_gap
             return session.query(Product).filter(
-                Product.quantity < Product.min_stock
+                (Product.quantity - Product.min_stock) < 0
             ).all()
         finally:
             session.close()
 
     def get_total_sales_amount(self, start_date=None, end_date=None):
+        """Сумма продаж; каждая граница периода необязательна"""
         session = self.Session()
         try:
-            query = session.query(func.sum(Sale.total))
-            if start_date and end_date:
-                query = query.filter(and_(Sale.date >= start_date, Sale.date <= end_date))
+            sale = self.sales_source(start_date)
+            query = session.query(func.sum(sale.total))
+            if start_date:
+                query = query.filter(sale.date >= start_date)
+            if end_date:
+                query = query.filter(sale.date <= end_date)
             return query.scalar() or 0
         finally:
             session.close()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# Профили настройки SQLite. Значения применяются PRAGMA-командами
+# к каждому новому соединению.
+ENGINE_PROFILES = {
+    # Настройки SQLite по умолчанию: журнал отката, synchronous=FULL
+    "default": {},
+    # WAL: читатели (отчеты, экспорт) не блокируют писателей (продажи)
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,  # в КиБ, около 64 МБ
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+# Порядок важен: journal_mode должен быть выставлен до остальных PRAGMA
+PRAGMA_ORDER = ["journal_mode", "busy_timeout", "synchronous", "cache_size",
+                "mmap_size", "temp_store"]
+
+
+def is_memory_url(db_url):
+    """База в памяти, а не в файле"""
+    database = make_url(db_url).database
+    return not database or database == ":memory:"
+
+
+def create_store_engine(db_url, profile="performance", pool_size=5, max_overflow=10,
+                        attach=None, **pragmas):
+    """Создать движок SQLAlchemy с выбранным профилем.
+
+    Отдельные PRAGMA можно переопределить именованными аргументами,
+    например create_store_engine(url, synchronous="FULL").
+    attach - словарь {схема: путь к файлу}: существующие файлы
+    присоединяются к каждому соединению командой ATTACH.
+    """
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль базы данных: {profile}")
+    settings = dict(ENGINE_PROFILES[profile])
+    settings.update(pragmas)
+
+    if is_memory_url(db_url):
+        # Одно общее соединение, иначе у каждого соединения своя пустая база
+        settings.pop("journal_mode", None)
+        settings.pop("mmap_size", None)
+        engine = create_engine(
+            db_url,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(
+            db_url,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            connect_args={"check_same_thread": False},
+        )
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        # pysqlite сам решает, когда открыть транзакцию, и не пускает
+        # BEGIN перед SELECT и DDL, из-за чего ломаются SAVEPOINT.
+        # Отключаем это и открываем транзакции явно в on_begin ниже.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for name in PRAGMA_ORDER:
+                if name in settings:
+                    cursor.execute(f"PRAGMA {name}={settings[name]}")
+            for name, value in settings.items():
+                if name not in PRAGMA_ORDER:
+                    cursor.execute(f"PRAGMA {name}={value}")
+            for schema, path in (attach or {}).items():
+                if os.path.exists(path):
+                    cursor.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+                    if "journal_mode" in settings:
+                        cursor.execute(f"PRAGMA {schema}.journal_mode={settings['journal_mode']}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
@@ -0,0 +1,367 @@
+import math
+import os
+from functools import partial
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from database.models import Product, Customer, Supply, ProductCategory, to_money
+from database.instrumentation import instrumented
+
+# Сколько строк файла обрабатывать одной транзакцией
+IMPORT_CHUNK_SIZE = 1000
+
+# Наибольшее число в файле: и количество, и сумма в копейках
+# помещаются в INTEGER SQLite
+MAX_NUMBER = 10 ** 15
+
+# Заголовки из нашего экспорта в Excel -> имена колонок импорта
+COLUMN_ALIASES = {
+    'Название': 'name', 'Категория': 'category', 'Цена': 'price',
+    'Количество': 'quantity', 'Мин. запас': 'min_stock', 'Штрихкод': 'barcode',
+    'Описание': 'description', 'Имя': 'name', 'Телефон': 'phone', 'Email': 'email',
+    'Скидка': 'discount', 'Поставщик': 'supplier', 'Стоимость': 'cost', 'Дата': 'date',
+}
+
+
+def read_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Читать CSV, XLSX или Parquet порциями DataFrame, не загружая файл целиком"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    elif ext in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(h) for h in next(rows, ())]
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            workbook.close()
+    elif ext == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Для импорта из Parquet установите пакет pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise Exception(f"Неподдерживаемый формат файла: {ext}")
+
+
+def _blank(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+
+def _text(value):
+    return None if _blank(value) else str(value).strip()
+
+
+def _number(value, kind, field, default=None):
+    if _blank(value):
+        if default is None:
+            raise ValueError(f"не заполнено поле {field}")
+        return default
+    try:
+        number = float(str(value).replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"некорректное значение {field}: {value}")
+    if not math.isfinite(number) or abs(number) > MAX_NUMBER:
+        raise ValueError(f"некорректное значение {field}: {value}")
+    if kind is int and not number.is_integer():
+        raise ValueError(f"нецелое значение {field}: {value}")
+    number = kind(number)
+    if number < 0:
+        raise ValueError(f"отрицательное значение {field}: {value}")
+    return number
+
+
+def _category(value):
+    text = _text(value)
+    if text is None:
+        return ProductCategory.OTHER
+    for category in ProductCategory:
+        if text.upper() == category.name or text == category.value:
+            return category
+    raise ValueError(f"неизвестная категория: {value}")
+
+
+def _movement(product_id, date, kind, change, quantity, ref_id=None):
+    """Строка журнала движений остатков (StockMovement)"""
+    return {'product_id': product_id, 'date': date, 'kind': kind, 'ref_id': ref_id,
+            'change': change, 'quantity': quantity}
+
+
+def read_counts(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Прочитать результаты пересчета для DatabaseManager.record_stock_take.
+
+    Каждая строка - barcode или product_id и quantity. Без quantity
+    строка считается одним отсканированным экземпляром, поэтому выгрузку
+    сканера (по строке на штуку) можно передать как есть. Повторы одного
+    товара суммируются. Возвращает (counts, errors).
+    """
+    counts = {}
+    errors = []
+    line = 2
+    for chunk in read_chunks(path, chunk_size):
+        chunk = chunk.rename(columns=COLUMN_ALIASES)
+        for row in chunk.to_dict('records'):
+            try:
+                barcode = _text(row.get('barcode'))
+                product_id = row.get('product_id')
+                if barcode:
+                    key = barcode
+                elif not _blank(product_id):
+                    key = _number(product_id, int, 'product_id')
+                else:
+                    raise ValueError("нужен product_id или barcode")
+                counts[key] = counts.get(key, 0) + _number(row.get('quantity'), int, 'quantity', 1)
+            except ValueError as e:
+                errors.append((line, str(e)))
+            line += 1
+    return counts, errors
+
+
+@instrumented
+class BulkImporter:
+    """Массовая загрузка товаров, клиентов и поставок из файлов.
+
+    Файл читается порциями; каждая порция пишется одной транзакцией
+    через executemany. Товары обновляются по штрихкоду, клиенты - по
+    телефону или email (INSERT ... ON CONFLICT DO UPDATE). Строки с
+    ошибками попадают в отчет и не прерывают загрузку: если порция
+    не прошла целиком, она повторяется построчно.
+
+    У существующих товаров и клиентов обновляются только колонки,
+    которые есть в файле. Остаток товара импорт товаров задает только
+    новым товарам; существующие меняют поставки и инвентаризация.
+
+    Каждый метод возвращает словарь {'processed', 'imported', 'errors'},
+    где errors - список (номер строки файла, сообщение).
+    """
+
+    def __init__(self, db_manager, chunk_size=IMPORT_CHUNK_SIZE):
+        self.db = db_manager
+        self.chunk_size = chunk_size
+
+    def import_products(self, path):
+        return self._import(path, self._parse_product, self._write_products)
+
+    def import_customers(self, path):
+        return self._import(path, self._parse_customer, self._write_customers)
+
+    def import_supplies(self, path):
+        return self._import(path, self._parse_supply, self._write_supplies)
+
+    def _import(self, path, parse, write):
+        result = {'processed': 0, 'imported': 0, 'errors': []}
+        # Номер строки в файле: 1 - заголовок, данные начинаются со 2
+        line = 2
+        for chunk in read_chunks(path, self.chunk_size):
+            chunk = chunk.rename(columns=COLUMN_ALIASES)
+            records = []
+            for row in chunk.to_dict('records'):
+                try:
+                    records.append((line, parse(row)))
+                except ValueError as e:
+                    result['errors'].append((line, str(e)))
+                line += 1
+            result['processed'] += len(chunk)
+            if records:
+                self._write_chunk(records, partial(write, columns=set(chunk.columns)), result)
+        return result
+
+    def _write_chunk(self, records, write, result):
+        try:
+            self.db.run_with_retry(self._write_transaction, write, [r for _, r in records])
+            result['imported'] += len(records)
+            return
+        except (IntegrityError, ValueError):
+            pass
+        # Ищем строки, из-за которых порция не прошла
+        for line, record in records:
+            try:
+                self.db.run_with_retry(self._write_transaction, write, [record])
+                result['imported'] += 1
+            except IntegrityError as e:
+                result['errors'].append((line, str(e.orig)))
+            except ValueError as e:
+                result['errors'].append((line, str(e)))
+
+    def _write_transaction(self, write, records):
+        session = self.db.Session()
+        try:
+            changes = write(session, records)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+        self.db.publish_changes(**changes)
+
+    # --- Товары ---
+
+    def _parse_product(self, row):
+        name = _text(row.get('name'))
+        if not name:
+            raise ValueError("не заполнено поле name")
+        return {
+            'name': name,
+            'category': _category(row.get('category')),
+            'price': to_money(_number(row.get('price'), float, 'price')),
+            'quantity': _number(row.get('quantity'), int, 'quantity', 0),
+            'min_stock': _number(row.get('min_stock'), int, 'min_stock', 10),
+            'barcode': _text(row.get('barcode')),
+            'description': _text(row.get('description')),
+        }
+
+    def _write_products(self, session, records, columns):
+        ids = []
+        movements = []
+        now = datetime.now()
+        # Повтор штрихкода в порции: действует последняя строка, как при
+        # построчной загрузке, и в журнал попадает одно движение на товар
+        with_barcode = list({r['barcode']: r for r in records if r['barcode']}.values())
+        without_barcode = [r for r in records if not r['barcode']]
+        if with_barcode:
+            existing = {barcode for (barcode,) in session.query(Product.barcode).filter(
+                Product.barcode.in_({r['barcode'] for r in with_barcode})
+            )}
+            # Существующий товар обновляется только колонками из файла:
+            # прайс без количества не должен обнулять остатки и запасы.
+            # Остаток не меняется никогда - это дело поставок и инвентаризации
+            stmt = sqlite_insert(Product)
+            updates = {name: getattr(stmt.excluded, name)
+                       for name in ('name', 'category', 'price', 'min_stock', 'description')
+                       if name in columns}
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Product.barcode], set_=updates
+            ).returning(Product.id, Product.barcode, Product.quantity)
+            for r in session.execute(stmt, with_barcode).all():
+                ids.append(r.id)
+                if r.barcode not in existing:
+                    movements.append(_movement(r.id, now, 'opening', r.quantity, r.quantity))
+        if without_barcode:
+            for r in session.execute(
+                insert(Product).returning(Product.id, Product.quantity), without_barcode
+            ).all():
+                ids.append(r.id)
+                movements.append(_movement(r.id, now, 'opening', r.quantity, r.quantity))
+        self.db._record_movements(session, movements)
+        return {'products': ids}
+
+    # --- Клиенты ---
+
+    def _parse_customer(self, row):
+        name = _text(row.get('name'))
+        if not name:
+            raise ValueError("не заполнено поле name")
+        discount = _number(row.get('discount'), float, 'discount', 0.0)
+        if discount > 100:
+            raise ValueError(f"скидка больше 100%: {discount}")
+        return {
+            'name': name,
+            'phone': _text(row.get('phone')),
+            'email': _text(row.get('email')),
+            'discount': discount,
+        }
+
+    def _write_customers(self, session, records, columns):
+        ids = []
+        by_phone = [r for r in records if r['phone']]
+        by_email = [r for r in records if not r['phone'] and r['email']]
+        plain = [r for r in records if not r['phone'] and not r['email']]
+        for key, rows in (('phone', by_phone), ('email', by_email)):
+            if not rows:
+                continue
+            stmt = sqlite_insert(Customer)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[getattr(Customer, key)],
+                set_={name: getattr(stmt.excluded, name)
+                      for name in ('name', 'phone', 'email', 'discount')
+                      if name != key and name in columns}
+            ).returning(Customer.id)
+            ids += session.execute(stmt, rows).scalars().all()
+        if plain:
+            ids += session.execute(insert(Customer).returning(Customer.id), plain).scalars().all()
+        return {'customers': ids}
+
+    # --- Поставки ---
+
+    def _parse_supply(self, row):
+        supplier = _text(row.get('supplier'))
+        if not supplier:
+            raise ValueError("не заполнено поле supplier")
+        product_id = row.get('product_id')
+        barcode = _text(row.get('barcode'))
+        if _blank(product_id) and not barcode:
+            raise ValueError("нужен product_id или barcode")
+        date = row.get('date')
+        return {
+            'supplier': supplier,
+            'product_id': None if _blank(product_id) else _number(product_id, int, 'product_id'),
+            'barcode': barcode,
+            'quantity': _number(row.get('quantity'), int, 'quantity'),
+            'cost': to_money(_number(row.get('cost'), float, 'cost')),
+            'date': datetime.now() if _blank(date) else pd.Timestamp(date).to_pydatetime(),
+        }
+
+    def _write_supplies(self, session, records, columns):
+        barcodes = {r['barcode'] for r in records if r['product_id'] is None}
+        by_barcode = {}
+        if barcodes:
+            by_barcode = dict(session.query(Product.barcode, Product.id).filter(
+                Product.barcode.in_(barcodes)
+            ).all())
+        product_ids = {r['product_id'] for r in records if r['product_id'] is not None}
+        known = {pid for (pid,) in session.query(Product.id).filter(Product.id.in_(product_ids))}
+        known |= set(by_barcode.values())
+
+        rows = []
+        for r in records:
+            product_id = r['product_id'] if r['product_id'] is not None else by_barcode.get(r['barcode'])
+            if product_id not in known:
+                raise ValueError(f"товар не найден: {r['product_id'] or r['barcode']}")
+            rows.append({'supplier': r['supplier'], 'product_id': product_id,
+                         'quantity': r['quantity'], 'cost': r['cost'], 'date': r['date']})
+
+        supply_ids = session.execute(insert(Supply).returning(Supply.id), rows).scalars().all()
+
+        added = {}
+        rollups = {}
+        for r in rows:
+            added[r['product_id']] = added.get(r['product_id'], 0) + r['quantity']
+            rollup = rollups.setdefault((r['date'].date(), r['product_id']), {})
+            rollup['supplied_quantity'] = rollup.get('supplied_quantity', 0) + r['quantity']
+            rollup['supply_cost'] = rollup.get('supply_cost', 0) + r['cost']
+        session.execute(
+            update(Product.__table__)
+            .where(Product.__table__.c.id == bindparam('pid'))
+            .values(quantity=Product.__table__.c.quantity + bindparam('added')),
+            [{'pid': pid, 'added': qty} for pid, qty in added.items()]
+        )
+        self.db._update_rollups(session, rollups)
+
+        # Остаток меняется в момент импорта, какой бы ни была дата поставки
+        now = datetime.now()
+        after = dict(session.query(Product.id, Product.quantity).filter(Product.id.in_(added)).all())
+        movements = []
+        for supply_id, r in reversed(list(zip(supply_ids, rows))):
+            movements.append(_movement(r['product_id'], now, 'supply', r['quantity'],
+                                       after[r['product_id']], supply_id))
+            after[r['product_id']] -= r['quantity']
+        self.db._record_movements(session, movements[::-1])
+        return {'supplies': supply_ids, 'products': added.keys()}
@@ -0,0 +1,207 @@
+import functools
+import inspect
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, мс
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_SIZE = 50
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+
+
+class Histogram:
+    """Распределение длительностей по фиксированным корзинам"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p):
+        """Оценка перцентиля сверху: граница корзины, куда он попал"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                bound = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'min_ms': round(self.min_ms or 0.0, 3),
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': {f"<={bound}": n for bound, n in zip(BUCKETS_MS, self.buckets) if n},
+        }
+
+
+class Metrics:
+    """Потокобезопасный набор гистограмм по именам.
+
+    Имена вида 'sql:<запрос>' пишет QueryInstrumentation, имена вида
+    'call:<Класс>.<метод>' - декоратор timed.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self.started = datetime.now()
+
+    def observe(self, name, ms):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def histogram(self, name):
+        with self._lock:
+            return self._histograms.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.slow_queries.clear()
+            self.started = datetime.now()
+
+    def snapshot(self, prefix=None):
+        """Словарь с гистограммами (по убыванию суммарного времени) и медленными запросами"""
+        with self._lock:
+            items = [(name, h.to_dict()) for name, h in self._histograms.items()
+                     if prefix is None or name.startswith(prefix)]
+            slow = list(self.slow_queries)
+        items.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        return {
+            'since': self.started.isoformat(timespec='seconds'),
+            'taken': datetime.now().isoformat(timespec='seconds'),
+            'metrics': dict(items),
+            'slow_queries': slow,
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+metrics = Metrics()
+
+
+def normalize_statement(statement):
+    """Текст запроса без лишних пробелов; списки IN (?, ?, ...) схлопываются,
+    чтобы один и тот же запрос с разным числом параметров попадал в одну гистограмму"""
+    statement = _WHITESPACE_RE.sub(" ", statement).strip()
+    return _IN_LIST_RE.sub("(?, ...)", statement)
+
+
+class QueryInstrumentation:
+    """Замер каждого SQL-запроса движка через before/after_cursor_execute.
+
+    Время пишется в гистограмму 'sql:<запрос>' и в общую 'sql:*'.
+    Запросы дольше slow_query_ms попадают в журнал (logging.WARNING)
+    и в список metrics.slow_queries.
+    """
+
+    def __init__(self, engine, registry=metrics, slow_query_ms=SLOW_QUERY_MS):
+        self.engine = engine
+        self.metrics = registry
+        self.slow_query_ms = slow_query_ms
+
+    def install(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        event.listen(self.engine, "handle_error", self._on_error)
+        return self
+
+    def remove(self):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+        event.remove(self.engine, "handle_error", self._on_error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _on_error(self, context):
+        # after_cursor_execute для упавшего запроса не вызывается
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        if not self.metrics.enabled:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        key = normalize_statement(statement)
+        self.metrics.observe("sql:*", ms)
+        self.metrics.observe(f"sql:{key}", ms)
+        if ms >= self.slow_query_ms:
+            params = repr(parameters)
+            if len(params) > 200:
+                params = params[:200] + "..."
+            self.metrics.slow_queries.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'ms': round(ms, 3),
+                'statement': key,
+                'parameters': params,
+                'executemany': executemany,
+            })
+            logger.warning("Медленный запрос (%.1f мс): %s %s", ms, key, params)
+
+
+def timed(name=None, registry=metrics):
+    """Декоратор: время вызова функции в гистограмму 'call:<name>'"""
+    def decorator(fn):
+        metric = f"call:{name or fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(metric, (time.perf_counter() - started) * 1000)
+        return wrapper
+    return decorator
+
+
+def instrumented(cls):
+    """Декоратор класса: timed для всех публичных методов"""
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith('_') and inspect.isfunction(value):
+            setattr(cls, attr, timed(f"{cls.__name__}.{attr}")(value))
+    return cls
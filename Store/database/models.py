@@ -1,10 +1,46 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Enum, Text, Index
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import enum
 
 Base = declarative_base()
 
+# Версия схемы в PRAGMA user_version; 1 - деньги хранятся в копейках,
+# 2 - id продаж, поставок и движений остатков не переиспользуются
+SCHEMA_VERSION = 2
+
+KOPECK = Decimal('0.01')
+
+
+def to_money(value):
+    """Сумма в рублях как Decimal с точностью до копейки"""
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(KOPECK, rounding=ROUND_HALF_UP)
+
+
+class Money(TypeDecorator):
+    """Денежная сумма: в базе целое число копеек, в Python - Decimal.
+
+    Суммы и сравнения в SQL идут по целым числам. Арифметика над
+    колонками (price * quantity) дает копейки без преобразования;
+    чтобы получить Decimal, оберните выражение в type_coerce(..., Money).
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value) * 100)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
+
 
 class ProductCategory(enum.Enum):
     ELECTRONICS = "Электроника"
@@ -21,7 +57,7 @@ class Product(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(200), nullable=False)
     category = Column(Enum(ProductCategory), nullable=False)
-    price = Column(Float, nullable=False)
+    price = Column(Money, nullable=False)
     quantity = Column(Integer, default=0)
     min_stock = Column(Integer, default=10)
     barcode = Column(String(100), unique=True)
@@ -32,6 +68,11 @@ class Product(Base):
     supplies = relationship("Supply", back_populates="product")
 
 
+# Индекс по выражению для поиска товаров с низким запасом:
+# запрос должен фильтровать именно по (quantity - min_stock)
+Index('ix_products_stock_gap', Product.quantity - Product.min_stock)
+
+
 class Customer(Base):
     """Модель клиента"""
     __tablename__ = 'customers'
@@ -41,7 +82,7 @@ class Customer(Base):
     phone = Column(String(20), unique=True)
     email = Column(String(100), unique=True)
     discount = Column(Float, default=0.0)
-    total_purchases = Column(Float, default=0.0)
+    total_purchases = Column(Money, default=0)
     created_at = Column(DateTime, default=datetime.now)
 
     sales = relationship("Sale", back_populates="customer")
@@ -50,13 +91,19 @@ class Customer(Base):
 class Sale(Base):
     """Модель продажи"""
     __tablename__ = 'sales'
+    __table_args__ = (
+        # Отчеты фильтруют по периоду и группируют по товару
+        Index('ix_sales_date_product', 'date', 'product_id'),
+        # id не переиспользуются после переноса старых строк в архив
+        {'sqlite_autoincrement': True},
+    )
 
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
-    customer_id = Column(Integer, ForeignKey('customers.id'))
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False, index=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'), index=True)
     quantity = Column(Integer, nullable=False)
-    price = Column(Float, nullable=False)
-    total = Column(Float, nullable=False)
+    price = Column(Money, nullable=False)
+    total = Column(Money, nullable=False)
     date = Column(DateTime, default=datetime.now)
 
     product = relationship("Product", back_populates="sales")
@@ -66,17 +113,35 @@ class Sale(Base):
 class Supply(Base):
     """Модель поставки"""
     __tablename__ = 'supplies'
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = Column(Integer, primary_key=True)
     supplier = Column(String(200), nullable=False)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
-    cost = Column(Float, nullable=False)
-    date = Column(DateTime, default=datetime.now)
+    cost = Column(Money, nullable=False)
+    date = Column(DateTime, default=datetime.now, index=True)
 
     product = relationship("Product", back_populates="supplies")
 
 
+class DailyRollup(Base):
+    """Дневные итоги по товару: продажи и поставки.
+
+    Обновляются в той же транзакции, что и запись продажи или поставки,
+    поэтому финансовые отчеты читают их вместо сырых sales и supplies.
+    """
+    __tablename__ = 'daily_rollups'
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    sold_quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Money, nullable=False, default=0)
+    discount = Column(Money, nullable=False, default=0)
+    supplied_quantity = Column(Integer, nullable=False, default=0)
+    supply_cost = Column(Money, nullable=False, default=0)
+
+
 class Employee(Base):
     """Модель сотрудника"""
     __tablename__ = 'employees'
@@ -84,7 +149,7 @@ class Employee(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     position = Column(String(100))
-    salary = Column(Float)
+    salary = Column(Money)
     hire_date = Column(DateTime, default=datetime.now)
     phone = Column(String(20))
     email = Column(String(100))
@@ -103,4 +168,66 @@ class InventoryCheck(Base):
     date = Column(DateTime, default=datetime.now)
     notes = Column(Text)
 
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
+
+class StockMovement(Base):
+    """Движение остатка товара: журнал, в который только добавляют.
+
+    Пишется в той же транзакции, что и изменение Product.quantity.
+    quantity - остаток после движения, поэтому остаток товара на любой
+    момент - это quantity последнего движения до этого момента.
+    kind: 'opening' (начальный остаток), 'sale', 'supply', 'stock_take',
+    'import'; ref_id - id продажи, поставки или проверки инвентаря.
+    """
+    __tablename__ = 'stock_movements'
+    __table_args__ = (
+        Index('ix_stock_movements_product_date', 'product_id', 'date'),
+        # Снимки остатков опираются на порядок id движений
+        {'sqlite_autoincrement': True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    date = Column(DateTime, nullable=False, index=True)
+    kind = Column(String(20), nullable=False)
+    ref_id = Column(Integer)
+    change = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+
+class StockSnapshot(Base):
+    """Снимок остатков всех товаров.
+
+    Снимок отражает журнал до движения last_movement_id включительно:
+    остатки на момент T - это последний снимок до T плюс движения
+    после него, а не вся история.
+    """
+    __tablename__ = 'stock_snapshots'
+
+    id = Column(Integer, primary_key=True)
+    taken_at = Column(DateTime, nullable=False, index=True)
+    last_movement_id = Column(Integer, nullable=False)
+
+
+class StockSnapshotItem(Base):
+    """Остаток одного товара в снимке"""
+    __tablename__ = 'stock_snapshot_items'
+
+    snapshot_id = Column(Integer, ForeignKey('stock_snapshots.id'), primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+
+class ArchiveRun(Base):
+    """Перенос старых продаж, поставок и движений остатков в архивную базу.
+
+    Строки с датой раньше before лежат в архиве; самый поздний before -
+    граница между оперативной и архивной частью.
+    """
+    __tablename__ = 'archive_runs'
+
+    id = Column(Integer, primary_key=True)
+    before = Column(DateTime, nullable=False)
+    date = Column(DateTime, default=datetime.now)
+    sales = Column(Integer, nullable=False, default=0)
+    supplies = Column(Integer, nullable=False, default=0)
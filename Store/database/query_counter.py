@@ -0,0 +1,44 @@
+from sqlalchemy import event
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK TO')
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов, выполненных движком внутри блока with.
+
+    Нужен, чтобы ловить N+1: число запросов отчета или экспорта
+    не должно зависеть от числа строк.
+
+        with QueryCounter(db.engine) as counter:
+            reports.generate_sales_report()
+        counter.assert_at_most(2)
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # BEGIN и точки сохранения - управление транзакцией, а не запросы к данным
+        if not statement.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        return False
+
+    def assert_at_most(self, limit):
+        if self.count > limit:
+            listing = "\n".join(self.statements)
+            raise AssertionError(
+                f"Выполнено {self.count} SQL-запросов, допустимо не более {limit}:\n{listing}"
+            )
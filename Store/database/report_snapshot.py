@@ -0,0 +1,173 @@
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# Снимок старше этого срока (секунды) обновляется перед отчетом
+REPORT_SNAPSHOT_MAX_AGE = 600
+# Как часто приложение обновляет снимок в фоне, секунды
+REPORT_SNAPSHOT_INTERVAL = 300
+
+
+class _Generation:
+    """Один снимок: его менеджер, время снятия и число читателей"""
+
+    def __init__(self, db, path, taken_at):
+        self.db = db
+        self.path = path
+        self.taken_at = taken_at
+        self.readers = 0
+
+
+class ReportSnapshot:
+    """Копия базы для отчетов и экспорта.
+
+    Тяжелые отчеты читают не рабочую базу, в которую пишут кассы, а ее
+    копию во временном файле, снятую online backup API SQLite за один
+    шаг (согласованное состояние на момент снятия). Копия обновляется
+    по расписанию (refresh) или по требованию: снимок старше max_age
+    обновляется перед отчетом.
+
+    Объект подставляется вместо DatabaseManager:
+
+        reports = InventoryReports(ReportSnapshot(db))
+
+    Атрибуты (Session, sales_source, get_stock_levels_at, ...) берутся
+    у менеджера текущего снимка. Внутри pinned() поток видит один и тот
+    же снимок, даже если тем временем снят новый, поэтому отчет из
+    нескольких запросов согласован. Старые снимки удаляются, когда их
+    перестают читать.
+
+    Архивная база (archive_old_data) не копируется, а присоединяется
+    как есть: строки ниже границы архива в ней не меняются, а граница
+    берется из копии основной базы.
+    """
+
+    def __init__(self, db_manager, max_age=REPORT_SNAPSHOT_MAX_AGE, directory=None):
+        self.live = db_manager
+        self.max_age = max_age
+        self._owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="store_reports_")
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+        self._current = None
+        self._retired = []
+        self._taken = 0
+
+    @property
+    def taken_at(self):
+        """Когда снята текущая копия (None - еще не снята)"""
+        current = self._current
+        return current.taken_at if current else None
+
+    def age(self):
+        """Возраст текущей копии в секундах (None - еще не снята)"""
+        taken_at = self.taken_at
+        return None if taken_at is None else (datetime.now() - taken_at).total_seconds()
+
+    def refresh(self):
+        """Снять новую копию рабочей базы; возвращает время снятия"""
+        with self._refresh_lock:
+            return self._take()
+
+    def ensure_fresh(self, max_age=None):
+        """Снять копию, если ее нет или она старше max_age секунд"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._refresh_lock:
+            age = self.age()
+            if age is None or age > max_age:
+                self._take()
+            return self.taken_at
+
+    def _take(self):
+        self._taken += 1
+        path = os.path.join(self.directory, f"report_{self._taken}.db")
+        started = time.perf_counter()
+        taken_at = datetime.now()
+        target = sqlite3.connect(path)
+        source = self.live.engine.raw_connection()
+        try:
+            # Вся база одним шагом: в WAL копирование идет в одной читающей
+            # транзакции и не мешает записи
+            source.driver_connection.backup(target)
+        finally:
+            source.close()
+            target.close()
+        db = DatabaseManager(f"sqlite:///{path}", archive_path=self.live.archive_path, cache_size=0)
+
+        with self._lock:
+            if self._current is not None:
+                self._retired.append(self._current)
+            self._current = _Generation(db, path, taken_at)
+            self._drop_retired()
+        logger.info("Снимок базы для отчетов снят за %.2f с", time.perf_counter() - started)
+        return taken_at
+
+    def _drop_retired(self):
+        for generation in [g for g in self._retired if not g.readers]:
+            self._retired.remove(generation)
+            generation.db.engine.dispose()
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(generation.path + suffix)
+                except OSError:
+                    pass
+
+    @contextmanager
+    def pinned(self):
+        """Читать один снимок до выхода из блока; дает время его снятия.
+
+            with snapshot.pinned() as taken_at:
+                report = reports.generate_sales_report()
+        """
+        generation = getattr(self._local, 'generation', None)
+        if generation is not None:
+            yield generation.taken_at
+            return
+        self.ensure_fresh()
+        with self._lock:
+            generation = self._current
+            generation.readers += 1
+        self._local.generation = generation
+        try:
+            yield generation.taken_at
+        finally:
+            self._local.generation = None
+            with self._lock:
+                generation.readers -= 1
+                self._drop_retired()
+
+    def run(self, fn, *args, **kwargs):
+        """Выполнить fn(*args, **kwargs) на одном снимке"""
+        with self.pinned():
+            return fn(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        generation = getattr(self._local, 'generation', None)
+        if generation is None:
+            self.ensure_fresh()
+            generation = self._current
+        return getattr(generation.db, name)
+
+    def close(self):
+        """Удалить все снимки (при закрытии приложения)"""
+        with self._lock:
+            if self._current is not None:
+                self._retired.append(self._current)
+                self._current = None
+            for generation in self._retired:
+                generation.readers = 0
+            self._drop_retired()
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,124 @@
+import re
+from bisect import bisect_left, insort
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+class ProductSearchIndex:
+    """Индекс товаров в памяти для поиска по мере ввода.
+
+    Названия и отдельные слова названий хранятся в отсортированных
+    списках, поэтому поиск по префиксу - это бинарный поиск и проход
+    по подходящему диапазону только до нужного числа результатов.
+    Штрихкоды ищутся точным совпадением в словаре.
+    """
+
+    def __init__(self):
+        self.products = {}  # id -> (name, barcode, quantity)
+        self._names = []  # отсортированные пары (название в нижнем регистре, id)
+        self._tokens = []  # отсортированные пары (слово, id)
+        self._product_tokens = {}
+        self._barcodes = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def build(self, rows):
+        """Построить индекс заново по строкам (id, name, barcode, quantity)"""
+        self.products = {}
+        self._product_tokens = {}
+        self._barcodes = {}
+        names = []
+        tokens = []
+        for row in rows:
+            self.products[row.id] = (row.name, row.barcode, row.quantity)
+            if row.barcode:
+                self._barcodes[row.barcode] = row.id
+            words = tuple(set(tokenize(row.name)))
+            self._product_tokens[row.id] = words
+            names.append((row.name.lower(), row.id))
+            tokens.extend((word, row.id) for word in words)
+        names.sort()
+        tokens.sort()
+        self._names = names
+        self._tokens = tokens
+        return self
+
+    def update(self, rows):
+        """Добавить или обновить отдельные товары"""
+        for row in rows:
+            old = self.products.get(row.id)
+            if old and old[0] == row.name and old[1] == row.barcode:
+                # Изменился только остаток
+                self.products[row.id] = (row.name, row.barcode, row.quantity)
+                continue
+            if old:
+                self.remove([row.id])
+            self.products[row.id] = (row.name, row.barcode, row.quantity)
+            if row.barcode:
+                self._barcodes[row.barcode] = row.id
+            words = tuple(set(tokenize(row.name)))
+            self._product_tokens[row.id] = words
+            insort(self._names, (row.name.lower(), row.id))
+            for word in words:
+                insort(self._tokens, (word, row.id))
+
+    def _discard(self, items, item):
+        i = bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def remove(self, product_ids):
+        for product_id in product_ids:
+            entry = self.products.pop(product_id, None)
+            if not entry:
+                continue
+            name, barcode, _ = entry
+            if barcode and self._barcodes.get(barcode) == product_id:
+                del self._barcodes[barcode]
+            self._discard(self._names, (name.lower(), product_id))
+            for word in self._product_tokens.pop(product_id, ()):
+                self._discard(self._tokens, (word, product_id))
+
+    def lookup_barcode(self, barcode):
+        """id товара по штрихкоду или None"""
+        return self._barcodes.get((barcode or "").strip())
+
+    def search(self, text, limit=20):
+        """До limit id товаров по строке запроса.
+
+        Сначала идут товары, название которых начинается с запроса
+        (по алфавиту), затем товары, у которых каждое слово запроса -
+        начало какого-то слова названия.
+        """
+        words = tokenize(text)
+        if not words:
+            return []
+        query = " ".join(words)
+        found = []
+        seen = set()
+
+        i = bisect_left(self._names, (query,))
+        while len(found) < limit and i < len(self._names) and self._names[i][0].startswith(query):
+            found.append(self._names[i][1])
+            seen.add(self._names[i][1])
+            i += 1
+
+        # Самое длинное слово обычно дает самый короткий диапазон
+        words.sort(key=len, reverse=True)
+        first, rest = words[0], words[1:]
+        i = bisect_left(self._tokens, (first,))
+        while len(found) < limit and i < len(self._tokens) and self._tokens[i][0].startswith(first):
+            product_id = self._tokens[i][1]
+            i += 1
+            if product_id in seen:
+                continue
+            product_words = self._product_tokens[product_id]
+            if all(any(w.startswith(word) for w in product_words) for word in rest):
+                found.append(product_id)
+                seen.add(product_id)
+        return found
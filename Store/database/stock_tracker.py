@@ -0,0 +1,162 @@
+import math
+import threading
+import logging
+from collections import namedtuple
+from datetime import date, timedelta
+from sqlalchemy import func, and_
+from database.models import Product, DailyRollup
+
+logger = logging.getLogger(__name__)
+
+# Окно для расчета скорости продаж и запас в днях для заказа
+VELOCITY_DAYS = 28
+LEAD_TIME_DAYS = 7
+COVER_DAYS = 14
+
+# kind: 'low' - остаток опустился ниже min_stock, 'restored' - восстановился
+StockAlert = namedtuple('StockAlert', 'kind product_id name quantity min_stock')
+ReorderProposal = namedtuple(
+    'ReorderProposal', 'product_id name quantity min_stock daily_sales order_quantity'
+)
+
+
+class LowStockTracker:
+    """Множество товаров с остатком ниже min_stock, обновляемое по событиям.
+
+    Порог и остаток каждого товара загружаются один раз при start(), затем
+    трекер слушает изменения DatabaseManager: новые остатки приходят в
+    событии ('stock'), а для товаров, измененных без остатка (новый
+    товар, импорт, правка), одним запросом читаются только их строки.
+    Полного прохода по каталогу после запуска нет.
+
+    При пересечении порога подписчики получают StockAlert. Они
+    вызываются в потоке, где прошла запись.
+    """
+
+    def __init__(self, db_manager, velocity_days=VELOCITY_DAYS,
+                 lead_time_days=LEAD_TIME_DAYS, cover_days=COVER_DAYS):
+        self.db = db_manager
+        self.velocity_days = velocity_days
+        self.lead_time_days = lead_time_days
+        self.cover_days = cover_days
+        self._lock = threading.Lock()
+        self._products = {}  # id -> [name, quantity, min_stock]
+        self._low = set()
+        self._listeners = []
+        self._started = False
+
+    def start(self):
+        """Загрузить пороги и подписаться на изменения базы"""
+        session = self.db.Session()
+        try:
+            rows = session.query(Product.id, Product.name, Product.quantity, Product.min_stock).all()
+        finally:
+            session.close()
+        with self._lock:
+            self._products = {r.id: [r.name, r.quantity or 0, r.min_stock or 0] for r in rows}
+            self._low = {pid for pid, (_, qty, min_stock) in self._products.items() if qty < min_stock}
+        if not self._started:
+            self.db.subscribe(self.on_changes)
+            self._started = True
+        return self
+
+    def stop(self):
+        if self._started:
+            self.db.unsubscribe(self.on_changes)
+            self._started = False
+
+    def subscribe(self, listener):
+        """listener(alert) вызывается на каждое пересечение порога"""
+        self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def low_stock_ids(self):
+        with self._lock:
+            return set(self._low)
+
+    def __len__(self):
+        return len(self._low)
+
+    def __contains__(self, product_id):
+        return product_id in self._low
+
+    def on_changes(self, changes):
+        stock = changes.get('stock', {})
+        products = changes.get('products', set())
+        unknown = [pid for pid in products if pid not in stock or pid not in self._products]
+        rows = []
+        if unknown:
+            session = self.db.Session()
+            try:
+                rows = session.query(
+                    Product.id, Product.name, Product.quantity, Product.min_stock
+                ).filter(Product.id.in_(unknown)).all()
+            finally:
+                session.close()
+
+        alerts = []
+        with self._lock:
+            for pid, quantity in stock.items():
+                entry = self._products.get(pid)
+                if entry is not None:
+                    entry[1] = quantity
+            for r in rows:
+                self._products[r.id] = [r.name, r.quantity or 0, r.min_stock or 0]
+            # Товары, которых больше нет в базе
+            for pid in set(unknown) - {r.id for r in rows}:
+                self._products.pop(pid, None)
+                self._low.discard(pid)
+            for pid in products | set(stock):
+                entry = self._products.get(pid)
+                if entry is None:
+                    continue
+                name, quantity, min_stock = entry
+                is_low = quantity < min_stock
+                if is_low and pid not in self._low:
+                    self._low.add(pid)
+                    alerts.append(StockAlert('low', pid, name, quantity, min_stock))
+                elif not is_low and pid in self._low:
+                    self._low.discard(pid)
+                    alerts.append(StockAlert('restored', pid, name, quantity, min_stock))
+
+        for alert in alerts:
+            for listener in list(self._listeners):
+                try:
+                    listener(alert)
+                except Exception:
+                    logger.exception("Ошибка обработчика оповещений об остатках")
+
+    def reorder_proposals(self, product_ids=None):
+        """Предложения заказа для товаров ниже порога (или для product_ids).
+
+        Скорость продаж - среднее в день за velocity_days по daily_rollups.
+        Заказ покрывает продажи на срок поставки плюс cover_days и
+        возвращает остаток хотя бы к min_stock.
+        """
+        ids = self.low_stock_ids() if product_ids is None else set(product_ids)
+        if not ids:
+            return []
+        since = date.today() - timedelta(days=self.velocity_days)
+        session = self.db.Session()
+        try:
+            sold = func.coalesce(func.sum(DailyRollup.sold_quantity), 0).label('sold')
+            rows = session.query(
+                Product.id, Product.name, Product.quantity, Product.min_stock, sold
+            ).outerjoin(
+                DailyRollup,
+                and_(DailyRollup.product_id == Product.id, DailyRollup.day >= since)
+            ).filter(Product.id.in_(ids)).group_by(Product.id).all()
+        finally:
+            session.close()
+
+        proposals = []
+        for r in rows:
+            daily = r.sold / self.velocity_days
+            target = daily * (self.lead_time_days + self.cover_days) + (r.min_stock or 0)
+            order = max(math.ceil(target - (r.quantity or 0)), 0)
+            proposals.append(ReorderProposal(r.id, r.name, r.quantity, r.min_stock, daily, order))
+        proposals.sort(key=lambda p: (p.quantity - p.min_stock, -p.daily_sales))
+        return proposals
@@ -0,0 +1,123 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей максимум в одной транзакции и сколько секунд ждать
+# попутчиков, если очередь опустела
+MAX_BATCH = 128
+MAX_DELAY = 0.002
+
+
+class WriteQueue:
+    """Очередь записей с групповой фиксацией (group commit).
+
+    Вызывающие потоки кладут записи в очередь и получают Future. Фоновый
+    поток забирает все накопившиеся записи (до max_batch штук, дожидаясь
+    попутчиков не дольше max_delay секунд) и фиксирует их одной
+    транзакцией через DatabaseManager.apply_writes: одна синхронизация
+    с диском на пачку вместо одной на запись. Ошибка записи (например,
+    нехватка товара) приходит в её Future и не влияет на остальные.
+
+    Подписчики DatabaseManager вызываются в потоке очереди.
+    """
+
+    def __init__(self, db_manager, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.db = db_manager
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {'batches': 0, 'writes': 0, 'max_batch': 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = True
+
+    def start(self):
+        with self._lock:
+            if not self._stopped:
+                return self
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="store-group-commit", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Зафиксировать уже принятые записи и остановить поток"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+        self._thread.join()
+
+    @property
+    def running(self):
+        return not self._stopped
+
+    def in_committer(self):
+        """Вызов идет из потока очереди (например, из подписчика)"""
+        return threading.current_thread() is self._thread
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, kind, args, convert=None):
+        """Поставить запись (вид из WRITE_OPERATIONS, аргументы) в очередь.
+
+        Future получит результат записи (пропущенный через convert,
+        если он задан) после фиксации пачки или исключение.
+        """
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise Exception("Очередь записи остановлена")
+            self._queue.put((kind, args, convert, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        # Время вышло, но уже стоящие в очереди записи забираем
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        # Отмененные до фиксации записи не выполняются
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.db.apply_writes([(kind, args) for kind, args, _, _ in batch])
+        except Exception as e:
+            logger.exception("Не удалось зафиксировать пачку записей")
+            results = [e] * len(batch)
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(batch)
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        for (_, _, convert, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(convert(result) if convert else result)
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import pandas as pd
+from sqlalchemy import select
+from database.models import Product, Customer
+from database.instrumentation import instrumented
+
+# Сколько строк читать из базы за один пакет
+COLUMNAR_CHUNK_SIZE = 50000
+
+WATERMARK_FILE = '_watermark.json'
+
+# Тип сумм в Parquet: decimal(точность, знаков после запятой)
+MONEY_DECIMAL = (18, 2)
+
+
+@instrumented
+class ColumnarExporter:
+    """Экспорт в Parquet/CSV для BI.
+
+    Каждая таблица выгружается в отдельный каталог из файлов-частей.
+    Продажи и поставки разбиты по месяцам (sales/month=2024-05/...).
+    При инкрементальном запуске выгружаются только строки с id больше
+    сохраненного в _watermark.json; справочники товаров и клиентов
+    небольшие и перезаписываются целиком.
+
+    Суммы выгружаются точными Decimal (decimal в Parquet), а не float:
+    pd.read_sql вызывается с coerce_float=False.
+    """
+
+    FORMATS = {'parquet': '.parquet', 'csv': '.csv'}
+
+    def __init__(self, db_manager, chunk_size=COLUMNAR_CHUNK_SIZE):
+        self.db = db_manager
+        self.chunk_size = chunk_size
+
+    def export_to_parquet(self, directory='store_export_parquet', incremental=True):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise Exception("Для экспорта в Parquet установите пакет pyarrow")
+        return self._export(directory, 'parquet', incremental)
+
+    def export_to_csv(self, directory='store_export_csv', incremental=True):
+        return self._export(directory, 'csv', incremental)
+
+    def _snapshot_tables(self):
+        products = select(
+            Product.id, Product.name, Product.category, Product.price,
+            Product.quantity, Product.min_stock, Product.barcode
+        ).order_by(Product.id)
+        customers = select(
+            Customer.id, Customer.name, Customer.phone, Customer.email,
+            Customer.discount, Customer.total_purchases
+        ).order_by(Customer.id)
+        return {'products': products, 'customers': customers}
+
+    def _incremental_tables(self, watermarks):
+        # Продажи и поставки вместе с архивом: полная выгрузка должна
+        # включать перенесенные строки, а фильтр по id работает в обеих частях
+        sale, supply = self.db.sales_source(), self.db.supplies_source()
+        sales = select(
+            sale.id, sale.date, sale.product_id,
+            Product.name.label('product_name'), sale.customer_id,
+            Customer.name.label('customer_name'), sale.quantity, sale.price, sale.total
+        ).outerjoin(Product, sale.product_id == Product.id).outerjoin(
+            Customer, sale.customer_id == Customer.id
+        ).where(sale.id > watermarks.get('sales', 0)).order_by(sale.id)
+        supplies = select(
+            supply.id, supply.date, supply.supplier, supply.product_id,
+            Product.name.label('product_name'), supply.quantity, supply.cost
+        ).outerjoin(Product, supply.product_id == Product.id).where(
+            supply.id > watermarks.get('supplies', 0)
+        ).order_by(supply.id)
+        return {'sales': sales, 'supplies': supplies}
+
+    def _read_watermarks(self, directory):
+        path = os.path.join(directory, WATERMARK_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_watermarks(self, directory, watermarks):
+        path = os.path.join(directory, WATERMARK_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f)
+        os.replace(tmp_path, path)
+
+    def _write_part(self, frame, path, fmt):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            # Точность decimal pyarrow выводит по значениям части; приводим
+            # суммы к одному типу, чтобы схема у всех частей совпадала
+            for i, field in enumerate(table.schema):
+                if pa.types.is_decimal(field.type):
+                    table = table.set_column(i, field.name, table.column(i).cast(pa.decimal128(*MONEY_DECIMAL)))
+            pq.write_table(table, path)
+        else:
+            frame.to_csv(path, index=False)
+
+    def _export(self, directory, fmt, incremental):
+        """Выгрузить все таблицы; возвращает число строк по таблицам"""
+        ext = self.FORMATS[fmt]
+        os.makedirs(directory, exist_ok=True)
+        watermarks = self._read_watermarks(directory) if incremental else {}
+        exported = {}
+
+        with self.db.engine.connect() as conn:
+            for table, query in self._snapshot_tables().items():
+                table_dir = os.path.join(directory, table)
+                shutil.rmtree(table_dir, ignore_errors=True)
+                exported[table] = 0
+                chunks = pd.read_sql(query, conn, chunksize=self.chunk_size, coerce_float=False)
+                for n, chunk in enumerate(chunks):
+                    if 'category' in chunk:
+                        chunk['category'] = chunk['category'].map(
+                            lambda c: c.value if hasattr(c, 'value') else c
+                        )
+                    self._write_part(chunk, os.path.join(table_dir, f'part-{n:05d}{ext}'), fmt)
+                    exported[table] += len(chunk)
+
+            for table, query in self._incremental_tables(watermarks).items():
+                table_dir = os.path.join(directory, table)
+                if not incremental:
+                    shutil.rmtree(table_dir, ignore_errors=True)
+                exported[table] = 0
+                for chunk in pd.read_sql(query, conn, chunksize=self.chunk_size, coerce_float=False,
+                                         parse_dates=['date']):
+                    if chunk.empty:
+                        continue
+                    months = chunk['date'].dt.strftime('%Y-%m')
+                    for month, part in chunk.groupby(months, sort=True):
+                        name = f"part-{part['id'].iloc[0]}-{part['id'].iloc[-1]}{ext}"
+                        self._write_part(
+                            part, os.path.join(table_dir, f'month={month}', name), fmt
+                        )
+                    watermarks[table] = int(chunk['id'].iloc[-1])
+                    exported[table] += len(chunk)
+
+        self._write_watermarks(directory, watermarks)
+        return exported
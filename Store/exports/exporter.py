@@ -1,79 +1,137 @@
-import pandas as pd
-from sqlalchemy import desc
-from database.models import Product, Sale, Customer, Supply
-
-class DataExporter:
-    """Модуль для экспорта данных в Excel"""
-    
-    def __init__(self, db_manager):
-        self.db = db_manager
-
-    def export_to_excel(self, filename='store_export.xlsx'):
-        session = self.db.Session()
-        try:
-            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-                
-                # --- 1. ТОВАРЫ ---
-                products_data = []
-                products = session.query(Product).all()
-                for p in products:
-                    cat_val = p.category.value if hasattr(p.category, 'value') else str(p.category)
-                    products_data.append({
-                        'ID': p.id,
-                        'Название': p.name,
-                        'Категория': cat_val,
-                        'Цена': p.price,
-                        'Количество': p.quantity,
-                        'Мин. запас': p.min_stock,
-                        'Суммарная стоимость': p.price * p.quantity
-                    })
-                if products_data:
-                    pd.DataFrame(products_data).to_excel(writer, sheet_name='Товары', index=False)
-
-                # --- 2. ПРОДАЖИ ---
-                sales_data = []
-                sales = session.query(Sale).order_by(desc(Sale.date)).all()
-                for s in sales:
-                    sales_data.append({
-                        'ID': s.id,
-                        'Дата': s.date.strftime('%Y-%m-%d %H:%M'),
-                        'Товар': s.product.name if s.product else "Удален",
-                        'Клиент': s.customer.name if s.customer else "Гость",
-                        'Количество': s.quantity,
-                        'Сумма': s.total
-                    })
-                if sales_data:
-                    pd.DataFrame(sales_data).to_excel(writer, sheet_name='Продажи', index=False)
-
-                # --- 3. КЛИЕНТЫ ---
-                customers_data = []
-                customers = session.query(Customer).all()
-                for c in customers:
-                    customers_data.append({
-                        'ID': c.id,
-                        'Имя': c.name,
-                        'Телефон': c.phone,
-                        'Покупки': c.total_purchases
-                    })
-                if customers_data:
-                    pd.DataFrame(customers_data).to_excel(writer, sheet_name='Клиенты', index=False)
-
-        # --- 4. ПОСТАВКИ ---
-                supplies_data = []
-                supplies = session.query(Supply).all()
-                for s in supplies:
-                    supplies_data.append({
-                        'Дата': s.date.strftime('%Y-%m-%d %H:%M'),
-                        'Поставщик': s.supplier,
-                        'Товар': s.product.name if s.product else "Удален",
-                        'Количество': s.quantity,
-                        'Стоимость': s.cost
-                    })
-                if supplies_data:
-                    pd.DataFrame(supplies_data).to_excel(writer, sheet_name='Поставки', index=False)
-
-            return filename
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
\ No newline at end of file
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import desc
+from database.models import Product, Customer
+from database.instrumentation import instrumented
+
+# Сколько строк забирать из базы за раз при потоковом экспорте
+EXPORT_CHUNK_SIZE = 2000
+
+
+@instrumented
+class DataExporter:
+    """Модуль для экспорта данных в Excel"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def _sheets(self, session):
+        """Описание листов: (название, заголовки, запрос, преобразование строки).
+
+        Запросы выбирают только нужные колонки, имена товара и клиента
+        берутся JOIN-ом, а не ленивой загрузкой на каждую строку.
+        Суммы (Decimal) пишутся числами float: pandas иначе сохранил
+        бы их в Excel текстом.
+        """
+        # Полная выгрузка: продажи и поставки вместе с архивом
+        sale, supply = self.db.sales_source(), self.db.supplies_source()
+
+        products = session.query(
+            Product.id, Product.name, Product.category,
+            Product.price, Product.quantity, Product.min_stock
+        ).order_by(Product.id)
+
+        sales = session.query(
+            sale.id, sale.date, sale.quantity, sale.total,
+            Product.name.label('product_name'),
+            Customer.name.label('customer_name')
+        ).outerjoin(Product, sale.product_id == Product.id).outerjoin(
+            Customer, sale.customer_id == Customer.id
+        ).order_by(desc(sale.date))
+
+        customers = session.query(
+            Customer.id, Customer.name, Customer.phone, Customer.total_purchases
+        ).order_by(Customer.id)
+
+        supplies = session.query(
+            supply.date, supply.supplier, supply.quantity, supply.cost,
+            Product.name.label('product_name')
+        ).outerjoin(Product, supply.product_id == Product.id).order_by(supply.id)
+
+        return [
+            ('Товары',
+             ['ID', 'Название', 'Категория', 'Цена', 'Количество', 'Мин. запас',
+              'Суммарная стоимость'],
+             products,
+             lambda p: (
+                 p.id, p.name,
+                 p.category.value if hasattr(p.category, 'value') else str(p.category),
+                 float(p.price), p.quantity, p.min_stock, float(p.price * p.quantity)
+             )),
+            ('Продажи',
+             ['ID', 'Дата', 'Товар', 'Клиент', 'Количество', 'Сумма'],
+             sales,
+             lambda s: (
+                 s.id, s.date.strftime('%Y-%m-%d %H:%M'),
+                 s.product_name if s.product_name is not None else "Удален",
+                 s.customer_name if s.customer_name is not None else "Гость",
+                 s.quantity, float(s.total)
+             )),
+            ('Клиенты',
+             ['ID', 'Имя', 'Телефон', 'Покупки'],
+             customers,
+             lambda c: (c.id, c.name, c.phone, float(c.total_purchases or 0))),
+            ('Поставки',
+             ['Дата', 'Поставщик', 'Товар', 'Количество', 'Стоимость'],
+             supplies,
+             lambda s: (
+                 s.date.strftime('%Y-%m-%d %H:%M'), s.supplier,
+                 s.product_name if s.product_name is not None else "Удален",
+                 s.quantity, float(s.cost)
+             )),
+        ]
+
+    def export_to_excel(self, filename='store_export.xlsx', streaming=False,
+                        progress=None, cancel=None):
+        """Выгрузить все таблицы в Excel.
+
+        streaming=True пишет строки порциями через write-only книгу openpyxl,
+        не собирая таблицы в памяти целиком.
+        """
+        if streaming:
+            return self.export_to_excel_streaming(filename, progress=progress, cancel=cancel)
+
+        session = self.db.Session()
+        try:
+            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+                for sheet_name, columns, query, to_row in self._sheets(session):
+                    rows = [to_row(r) for r in query]
+                    if rows:
+                        pd.DataFrame.from_records(rows, columns=columns).to_excel(
+                            writer, sheet_name=sheet_name, index=False
+                        )
+            return filename
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
+
+    def export_to_excel_streaming(self, filename='store_export.xlsx',
+                                  chunk_size=EXPORT_CHUNK_SIZE, progress=None, cancel=None):
+        """Потоковый экспорт в Excel с постоянным расходом памяти.
+
+        progress(done, total) вызывается после каждого листа; если
+        cancel() вернул True, экспорт прерывается без записи файла
+        и возвращается None.
+        """
+        session = self.db.Session()
+        try:
+            workbook = Workbook(write_only=True)
+            sheets = self._sheets(session)
+            for done, (sheet_name, columns, query, to_row) in enumerate(sheets):
+                sheet = workbook.create_sheet(sheet_name)
+                sheet.append(columns)
+                for n, r in enumerate(query.yield_per(chunk_size)):
+                    if cancel and n % chunk_size == 0 and cancel():
+                        for ws in workbook.worksheets:
+                            ws.close()
+                        return None
+                    sheet.append(to_row(r))
+                if progress:
+                    progress(done + 1, len(sheets))
+            workbook.save(filename)
+            return filename
+        except Exception as e:
+            raise e
+        finally:
+            session.close()
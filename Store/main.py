@@ -1,7 +1,16 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QTableWidgetItem, QMessageBox
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
 from ui.main_window import ModernMainWindow
+from ui.table_models import LazyTableModel
+from ui.workers import TaskRunner, ChangeRelay
+from ui.diagnostics import DiagnosticsDialog, status_summary
+from database.search_index import ProductSearchIndex
+from database.archive import ARCHIVE_AFTER_DAYS
 from database.db_manager import DatabaseManager
+from database.report_snapshot import ReportSnapshot, REPORT_SNAPSHOT_INTERVAL
+from database.importer import BulkImporter, read_counts
+from database.stock_tracker import LowStockTracker
 from reports.inventory_reports import InventoryReports
 from exports.exporter import DataExporter
 from database.models import ProductCategory
@@ -12,19 +21,105 @@ class StoreApp:
         self.app.setApplicationName("Store Management System")
         
         self.db = DatabaseManager()
-        self.reports = InventoryReports(self.db)
-        self.exporter = DataExporter(self.db)
+        # Отчеты и экспорт читают копию базы, а не базу, в которую пишут кассы
+        self.report_snapshot = ReportSnapshot(self.db)
+        self.reports = InventoryReports(self.report_snapshot)
+        self.exporter = DataExporter(self.report_snapshot)
+        self.importer = BulkImporter(self.db)
         
         self.main_window = ModernMainWindow()
         
         self.main_window.show_message = self.show_message_box 
         
+        # Работа с базой, отчеты и экспорт идут в пуле потоков;
+        # события изменений возвращаются в поток интерфейса через сигнал
+        self.tasks = TaskRunner(parent=self.main_window)
+        self.change_relay = ChangeRelay(self.main_window)
+        self.change_relay.changed.connect(self.on_data_changed)
+        self.export_token = None
+        self.product_index = None
+        self.pending_index_updates = set()
+        
+        self.setup_table_models()
         self.connect_signals()
         self.load_initial_data()
+        self.db.subscribe(self.change_relay)
+
+        # Товары ниже минимального остатка отслеживаются по событиям записи
+        self.stock_tracker = LowStockTracker(self.db)
+        self.stock_alert_relay = ChangeRelay(self.main_window)
+        self.stock_alert_relay.changed.connect(self.on_stock_alert)
+        self.stock_tracker.subscribe(self.stock_alert_relay)
+        self.tasks.submit(self.stock_tracker.start, on_done=lambda _: self.update_low_stock_label())
+        # Снимок остатков для запросов "остаток на дату", если прошлый устарел
+        self.tasks.submit(self.db.ensure_stock_snapshot)
+
+        self.diagnostics_timer = QTimer(self.main_window)
+        self.diagnostics_timer.timeout.connect(self.update_diagnostics_label)
+        self.diagnostics_timer.start(2000)
+
+        self.refresh_report_snapshot()
+        self.report_snapshot_timer = QTimer(self.main_window)
+        self.report_snapshot_timer.timeout.connect(self.refresh_report_snapshot)
+        self.report_snapshot_timer.start(REPORT_SNAPSHOT_INTERVAL * 1000)
         
     def show_message_box(self, title, text):
         QMessageBox.information(self.main_window, title, text)
 
+    def setup_table_models(self):
+        """Таблицы читают строки из базы страницами по мере прокрутки"""
+        w = self.main_window
+        self.products_model = LazyTableModel(
+            ["ID", "Название", "Категория", "Цена", "Количество", "Минимум", "Статус"],
+            self.db.get_products_page, self.format_product_row,
+            fetch_rows=self.db.get_product_rows, parent=w)
+        self.sales_model = LazyTableModel(
+            ["ID", "Дата", "Товар", "Количество", "Сумма", "Клиент"],
+            self.db.get_sales_page, self.format_sale_row,
+            fetch_rows=self.db.get_sale_rows, newest_first=True, parent=w)
+        self.supplies_model = LazyTableModel(
+            ["ID", "Дата", "Поставщик", "Товар", "Количество", "Стоимость"],
+            self.db.get_supplies_page, self.format_supply_row,
+            fetch_rows=self.db.get_supply_rows, newest_first=True, parent=w)
+        self.customers_model = LazyTableModel(
+            ["ID", "Имя", "Телефон", "Email", "Скидка"],
+            self.db.get_customers_page, self.format_customer_row,
+            fetch_rows=self.db.get_customer_rows, parent=w)
+
+        w.products_table.setModel(self.products_model)
+        w.sales_history_table.setModel(self.sales_model)
+        w.supplies_table.setModel(self.supplies_model)
+        w.customers_table.setModel(self.customers_model)
+
+    @staticmethod
+    def format_product_row(p):
+        cat_val = p.category.value if hasattr(p.category, 'value') else str(p.category)
+        status = "В наличии"
+        if p.quantity == 0: status = "Нет"
+        elif p.quantity < p.min_stock: status = "Мало"
+        return (str(p.id), p.name, cat_val, f"{p.price}", str(p.quantity), str(p.min_stock), status)
+
+    @staticmethod
+    def format_sale_row(s):
+        return (
+            str(s.id), s.date.strftime('%d.%m.%Y %H:%M'),
+            s.product_name if s.product_name is not None else "Удален",
+            str(s.quantity), f"{s.total:.2f} ₽",
+            s.customer_name if s.customer_name is not None else "Гость",
+        )
+
+    @staticmethod
+    def format_supply_row(s):
+        return (
+            str(s.id), s.date.strftime('%d.%m.%Y %H:%M'), s.supplier,
+            s.product_name if s.product_name is not None else "Удален",
+            str(s.quantity), f"{s.cost} ₽",
+        )
+
+    @staticmethod
+    def format_customer_row(c):
+        return (str(c.id), c.name, c.phone or "", c.email or "", f"{c.discount or 0} %")
+
     def connect_signals(self):
         self.main_window.add_product_btn.clicked.connect(self.add_product)
         self.main_window.refresh_products_btn.clicked.connect(self.refresh_products)
@@ -35,30 +130,94 @@ class StoreApp:
         # Отчеты и Экспорт
         self.main_window.sales_report_btn.clicked.connect(self.show_sales_report)
         self.main_window.inventory_report_btn.clicked.connect(self.show_inventory_report)
+        self.main_window.financial_report_btn.clicked.connect(self.show_financial_report)
+        self.main_window.reorder_report_btn.clicked.connect(self.show_reorder_report)
+        self.main_window.shrinkage_report_btn.clicked.connect(self.show_shrinkage_report)
+        self.main_window.turnover_report_btn.clicked.connect(self.show_turnover_report)
+        self.main_window.stock_take_action.triggered.connect(self.stock_take)
         self.main_window.export_excel_btn.clicked.connect(self.export_to_excel)
         self.main_window.export_action.triggered.connect(self.export_to_excel)
+        self.main_window.cancel_task_btn.clicked.connect(self.cancel_export)
+        self.main_window.import_products_action.triggered.connect(
+            lambda: self.import_file(self.importer.import_products))
+        self.main_window.import_customers_action.triggered.connect(
+            lambda: self.import_file(self.importer.import_customers))
+        self.main_window.import_supplies_action.triggered.connect(
+            lambda: self.import_file(self.importer.import_supplies))
+        self.main_window.diagnostics_action.triggered.connect(self.show_diagnostics)
+        self.main_window.archive_action.triggered.connect(self.archive_old_data)
+        self.main_window.refresh_report_data_action.triggered.connect(self.refresh_report_snapshot)
+        self.app.aboutToQuit.connect(self.tasks.wait)
+        self.app.aboutToQuit.connect(self.report_snapshot.close)
         
     def load_initial_data(self):
         self.refresh_products()
+        self.refresh_supplies()
+        self.sales_model.reload()
+        self.customers_model.reload()
         self.update_ui_combos()
         
+    def product_search_boxes(self):
+        return (self.main_window.sale_product_search, self.main_window.supply_product_search)
+
     def update_ui_combos(self):
         """Важно: сохраняем ID объектов в user_data комбобокса"""
-        self.main_window.sale_product_combo.clear()
         self.main_window.sale_customer_combo.clear()
-        self.main_window.supply_product_combo.clear()
-        
-        products = self.db.get_all_products()
-        for p in products:
-            text = f"{p.name} ({p.quantity} шт.)"
-            self.main_window.sale_product_combo.addItem(text, p.id)
-            self.main_window.supply_product_combo.addItem(text, p.id)
+
+        # Индекс поиска товаров строится в фоне; до готовности
+        # штрихкоды ищутся запросом к базе
+        self.product_index = None
+        for box in self.product_search_boxes():
+            box.barcode_lookup = self.db.find_product_id_by_barcode
+        self.tasks.submit(
+            lambda: ProductSearchIndex().build(self.db.get_product_search_rows()),
+            on_done=self.on_product_index_ready
+        )
             
         customers = self.db.get_all_customers()
         self.main_window.sale_customer_combo.addItem("Гость", None)
         for c in customers:
             self.main_window.sale_customer_combo.addItem(c.name, c.id)
 
+    def on_data_changed(self, changes):
+        """Точечно обновить строки таблиц и пункты списков после записи в базу"""
+        if 'products' in changes:
+            self.products_model.apply_changes(changes['products'])
+            self.update_product_search(changes['products'])
+        if 'customers' in changes:
+            self.customers_model.apply_changes(changes['customers'])
+            self.update_customer_combo(changes['customers'])
+        if 'sales' in changes:
+            self.sales_model.apply_changes(changes['sales'])
+        if 'supplies' in changes:
+            self.supplies_model.apply_changes(changes['supplies'])
+
+    def on_product_index_ready(self, index):
+        self.product_index = index
+        for box in self.product_search_boxes():
+            box.set_index(index)
+        # Изменения, пришедшие во время построения индекса
+        if self.pending_index_updates:
+            self.update_product_search(self.pending_index_updates)
+            self.pending_index_updates = set()
+
+    def update_product_search(self, product_ids):
+        if self.product_index is None:
+            self.pending_index_updates |= set(product_ids)
+            return
+        self.product_index.update(self.db.get_product_search_rows(product_ids))
+        for box in self.product_search_boxes():
+            box.refresh_labels()
+
+    def update_customer_combo(self, customer_ids):
+        combo = self.main_window.sale_customer_combo
+        for c in self.db.get_customer_rows(customer_ids):
+            index = combo.findData(c.id)
+            if index == -1:
+                combo.addItem(c.name, c.id)
+            else:
+                combo.setItemText(index, c.name)
+
     def add_product(self):
         try:
             name = self.main_window.product_name_input.text().strip()
@@ -80,8 +239,6 @@ class StoreApp:
 
             self.db.add_product(name, category, price, quantity, min_stock)
             self.main_window.show_message("Успех", "Товар добавлен")
-            self.refresh_products()
-            self.update_ui_combos()
             
             self.main_window.product_name_input.clear()
             self.main_window.product_price_input.setValue(0)
@@ -90,55 +247,21 @@ class StoreApp:
             self.main_window.show_message("Ошибка", str(e))
 
     def refresh_products(self):
-        products = self.db.get_all_products()
-        table = self.main_window.products_table
-        table.setRowCount(len(products))
-        
-        for row, p in enumerate(products):
-            cat_val = p.category.value if hasattr(p.category, 'value') else str(p.category)
-            
-            table.setItem(row, 0, QTableWidgetItem(str(p.id)))
-            table.setItem(row, 1, QTableWidgetItem(p.name))
-            table.setItem(row, 2, QTableWidgetItem(cat_val))
-            table.setItem(row, 3, QTableWidgetItem(f"{p.price}"))
-            table.setItem(row, 4, QTableWidgetItem(str(p.quantity)))
-            table.setItem(row, 5, QTableWidgetItem(str(p.min_stock)))
-            
-            status = "В наличии"
-            if p.quantity == 0: status = "Нет"
-            elif p.quantity < p.min_stock: status = "Мало"
-            table.setItem(row, 6, QTableWidgetItem(status))
+        self.products_model.reload()
 
     def refresh_supplies(self):
         """Обновление таблицы поставок"""
-        table = self.main_window.supplies_table
-        table.setRowCount(0)
-        
-        session = self.db.Session()
-        try:
-            # Получаем все поставки из базы
-            from database.models import Supply
-            supplies = session.query(Supply).all()
-            
-            for row, s in enumerate(supplies):
-                table.insertRow(row)
-                table.setItem(row, 0, QTableWidgetItem(s.date.strftime('%d.%m.%Y %H:%M')))
-                table.setItem(row, 1, QTableWidgetItem(s.product.name if s.product else "Удален"))
-                table.setItem(row, 2, QTableWidgetItem(str(s.quantity)))
-                table.setItem(row, 3, QTableWidgetItem(f"{s.cost} ₽"))
-                table.setItem(row, 4, QTableWidgetItem(s.supplier))
-        finally:
-            session.close()
+        self.supplies_model.reload()
 
     def process_sale(self):
         try:
-            # Получаем ID из скрытых данных комбобокса
-            p_idx = self.main_window.sale_product_combo.currentIndex()
+            product_id = self.main_window.sale_product_search.currentData()
             c_idx = self.main_window.sale_customer_combo.currentIndex()
             
-            if p_idx == -1: return
+            if product_id is None:
+                self.main_window.show_message("Ошибка", "Выберите товар из списка")
+                return
 
-            product_id = self.main_window.sale_product_combo.itemData(p_idx)
             customer_id = self.main_window.sale_customer_combo.itemData(c_idx)
             qty = self.main_window.sale_quantity_spin.value()
             
@@ -146,17 +269,29 @@ class StoreApp:
                 self.main_window.show_message("Ошибка", "Количество должно быть > 0")
                 return
 
-            self.db.record_sale(product_id, qty, customer_id)
-            self.main_window.show_message("Успех", "Продажа оформлена")
-            self.refresh_products()
-            self.update_ui_combos()
+            self.main_window.process_sale_btn.setEnabled(False)
+            self.tasks.submit(
+                self.db.record_sale, product_id, qty, customer_id,
+                on_done=lambda _: self.on_write_done(
+                    self.main_window.process_sale_btn, "Продажа оформлена"),
+                on_error=lambda msg: self.on_write_failed(
+                    self.main_window.process_sale_btn, "Ошибка продажи", msg)
+            )
             
         except Exception as e:
             self.main_window.show_message("Ошибка продажи", str(e))
 
+    def on_write_done(self, button, text):
+        button.setEnabled(True)
+        self.main_window.show_message("Успех", text)
+
+    def on_write_failed(self, button, title, text):
+        button.setEnabled(True)
+        self.main_window.show_message(title, text)
+
     def add_supply(self):
         try:
-            p_id = self.main_window.supply_product_combo.currentData()
+            p_id = self.main_window.supply_product_search.currentData()
             
             if p_id is None:
                 self.main_window.show_message("Ошибка", "Выберите товар из списка")
@@ -170,11 +305,15 @@ class StoreApp:
                 self.main_window.show_message("Ошибка", "Введите имя поставщика")
                 return
 
-            self.db.add_supply(supplier, p_id, qty, cost)
-
-            self.main_window.show_message("Успех", "Поставка оформлена")
-            self.refresh_products()  
-            self.refresh_supplies()  
+            self.main_window.add_supply_btn.setEnabled(False)
+            self.tasks.submit(
+                self.db.add_supply, supplier, p_id, qty, cost,
+                on_done=lambda _: self.on_write_done(
+                    self.main_window.add_supply_btn, "Поставка оформлена"),
+                on_error=lambda msg: self.on_write_failed(
+                    self.main_window.add_supply_btn, "Ошибка",
+                    f"Ошибка при добавлении поставки: {msg}")
+            )
             
         except Exception as e:
             self.main_window.show_message("Ошибка", f"Ошибка при добавлении поставки: {str(e)}")
@@ -182,37 +321,214 @@ class StoreApp:
     def add_customer(self):
         try:
             name = self.main_window.customer_name_input.text()
-            phone = self.main_window.customer_phone_input.text()
-            email = self.main_window.customer_email_input.text()
+            phone = self.main_window.customer_phone_input.text() or None
+            email = self.main_window.customer_email_input.text() or None
+            discount = self.main_window.customer_discount_spin.value()
             
             if not name: return
             
-            s = self.db.Session()
-            from database.models import Customer
-            new_c = Customer(name=name, phone=phone, email=email)
-            s.add(new_c)
-            s.commit()
-            s.close()
-            
+            self.db.add_customer(name, phone, email, discount)
             self.main_window.show_message("Успех", "Клиент добавлен")
-            self.update_ui_combos()
         except Exception as e:
              self.main_window.show_message("Ошибка", str(e))
 
-    def show_sales_report(self):
-        report = self.reports.generate_sales_report()
+    def show_report(self, generate):
+        def run():
+            with self.report_snapshot.pinned() as taken_at:
+                return f"Данные на {taken_at.strftime('%d.%m.%Y %H:%M:%S')}\n\n" + generate()
+
+        self.main_window.status_bar.showMessage("Формирование отчета...")
+        self.tasks.submit(
+            run,
+            on_done=self.on_report_ready,
+            on_error=lambda msg: self.main_window.show_message("Ошибка", f"Не удалось сформировать отчет: {msg}")
+        )
+
+    def on_report_ready(self, report):
         self.main_window.report_text.setPlainText(report)
+        self.main_window.status_bar.showMessage("Готово")
+
+    def show_sales_report(self):
+        self.show_report(self.reports.generate_sales_report)
 
     def show_inventory_report(self):
-        report = self.reports.generate_inventory_report()
-        self.main_window.report_text.setPlainText(report)
+        self.show_report(self.reports.generate_inventory_report)
+
+    def show_financial_report(self):
+        self.show_report(self.reports.generate_financial_report)
+
+    def show_reorder_report(self):
+        self.show_report(
+            lambda: self.reports.generate_reorder_report(self.stock_tracker.reorder_proposals())
+        )
+
+    def show_shrinkage_report(self):
+        self.show_report(self.reports.generate_shrinkage_report)
+
+    def show_turnover_report(self):
+        self.show_report(self.reports.generate_turnover_report)
+
+    def stock_take(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self.main_window, "Инвентаризация", "", "Пересчет (*.csv *.xlsx *.parquet)"
+        )
+        if not path:
+            return
+
+        def run():
+            counts, errors = read_counts(path)
+            result = self.db.record_stock_take(counts, notes=path)
+            result['errors'] = errors
+            return result
+
+        self.main_window.status_bar.showMessage("Инвентаризация...")
+        self.tasks.submit(
+            run, on_done=self.on_stock_take_done,
+            on_error=lambda msg: self.main_window.show_message("Ошибка", f"Инвентаризация не проведена: {msg}")
+        )
+
+    def on_stock_take_done(self, result):
+        self.main_window.status_bar.showMessage("Готово")
+        self.refresh_report_snapshot()
+        text = (
+            f"Проверено товаров: {result['counted']}, исправлено остатков: {result['changed']}\n"
+            f"Недостача: {result['shortage']} шт. на {result['shortage_value']:.2f} ₽\n"
+            f"Излишки: {result['surplus']} шт."
+        )
+        if result['unknown']:
+            text += f"\nНе найдено в базе: {', '.join(result['unknown'][:20])}"
+        if result['errors']:
+            text += f"\nОшибок в файле: {len(result['errors'])}"
+        self.main_window.show_message("Инвентаризация", text)
+
+    def on_stock_alert(self, alert):
+        if alert.kind == 'low':
+            self.main_window.status_bar.showMessage(
+                f"Мало товара: {alert.name} ({alert.quantity} шт., минимум {alert.min_stock})", 10000
+            )
+        self.update_low_stock_label()
+
+    def update_low_stock_label(self):
+        count = len(self.stock_tracker)
+        self.main_window.low_stock_label.setText(f"Ниже минимума: {count}" if count else "")
 
     def export_to_excel(self):
-        try:
-            file = self.exporter.export_to_excel()
-            self.main_window.show_message("Экспорт", f"Файл сохранен: {file}")
-        except Exception as e:
-            self.main_window.show_message("Ошибка", f"Не удалось экспортировать: {e}")
+        if self.export_token is not None:
+            self.main_window.show_message("Экспорт", "Экспорт уже выполняется")
+            return
+        w = self.main_window
+        w.task_progress.setRange(0, 0)
+        w.task_progress.setVisible(True)
+        w.cancel_task_btn.setVisible(True)
+        w.status_bar.showMessage("Экспорт в Excel...")
+        self.export_token = self.tasks.submit(
+            self.report_snapshot.run, self.exporter.export_to_excel, streaming=True, with_progress=True,
+            on_done=self.on_export_done,
+            on_error=self.on_export_failed,
+            on_progress=self.on_export_progress,
+            on_cancel=self.on_export_cancelled
+        )
+
+    def cancel_export(self):
+        if self.export_token is not None:
+            self.export_token.cancel()
+
+    def on_export_progress(self, done, total):
+        self.main_window.task_progress.setRange(0, total)
+        self.main_window.task_progress.setValue(done)
+
+    def finish_export(self, status):
+        self.export_token = None
+        self.main_window.task_progress.setVisible(False)
+        self.main_window.cancel_task_btn.setVisible(False)
+        self.main_window.status_bar.showMessage(status)
+
+    def on_export_done(self, file):
+        self.finish_export("Готово")
+        self.main_window.show_message("Экспорт", f"Файл сохранен: {file}")
+
+    def on_export_failed(self, error):
+        self.finish_export("Готово")
+        self.main_window.show_message("Ошибка", f"Не удалось экспортировать: {error}")
+
+    def on_export_cancelled(self):
+        self.finish_export("Экспорт отменен")
+
+    def import_file(self, load):
+        path, _ = QFileDialog.getOpenFileName(
+            self.main_window, "Импорт", "", "Данные (*.csv *.xlsx *.parquet)"
+        )
+        if not path:
+            return
+        self.main_window.status_bar.showMessage("Импорт...")
+        self.tasks.submit(load, path, on_done=self.on_import_done, on_error=self.on_import_failed)
+
+    def on_import_done(self, result):
+        self.main_window.status_bar.showMessage("Готово")
+        self.refresh_report_snapshot()
+        text = f"Обработано строк: {result['processed']}, загружено: {result['imported']}"
+        errors = result['errors']
+        if errors:
+            text += f"\nОшибок: {len(errors)}\n" + "\n".join(
+                f"Строка {line}: {message}" for line, message in errors[:20]
+            )
+            if len(errors) > 20:
+                text += "\n..."
+        self.main_window.show_message("Импорт", text)
+
+    def on_import_failed(self, error):
+        self.main_window.status_bar.showMessage("Готово")
+        self.main_window.show_message("Ошибка", f"Не удалось импортировать: {error}")
+
+    def update_diagnostics_label(self):
+        self.main_window.sql_stats_label.setText(status_summary())
+        self.update_report_age_label()
+
+    def refresh_report_snapshot(self):
+        self.tasks.submit(
+            self.report_snapshot.refresh,
+            on_done=lambda _: self.update_report_age_label(),
+            on_error=lambda msg: self.main_window.status_bar.showMessage(
+                f"Не удалось обновить данные отчетов: {msg}", 10000)
+        )
+
+    def update_report_age_label(self):
+        age = self.report_snapshot.age()
+        if age is None:
+            text = "Отчеты: данные не сняты"
+        elif age < 60:
+            text = "Отчеты: данные только что"
+        else:
+            text = f"Отчеты: данные {int(age // 60)} мин назад"
+        self.main_window.report_age_label.setText(text)
+
+    def show_diagnostics(self):
+        DiagnosticsDialog(self.db.diagnostics, self.main_window).exec_()
+
+    def archive_old_data(self):
+        answer = QMessageBox.question(
+            self.main_window, "Архив",
+            f"Перенести продажи, поставки и движения остатков старше {ARCHIVE_AFTER_DAYS} дней в архив?"
+        )
+        if answer != QMessageBox.Yes:
+            return
+        self.main_window.status_bar.showMessage("Перенос в архив...")
+        self.tasks.submit(
+            self.db.archive_old_data, on_done=self.on_archive_done,
+            on_error=lambda msg: self.main_window.show_message("Ошибка", f"Не удалось перенести в архив: {msg}")
+        )
+
+    def on_archive_done(self, result):
+        self.main_window.status_bar.showMessage("Готово")
+        self.refresh_report_snapshot()
+        self.sales_model.reload()
+        self.refresh_supplies()
+        self.main_window.show_message(
+            "Архив",
+            f"Перенесено продаж: {result['sales']}, поставок: {result['supplies']}, "
+            f"движений остатков: {result['stock_movements']}\n"
+            f"Граница архива: {result['before'].strftime('%d.%m.%Y')}"
+        )
 
     def run(self):
         self.main_window.show()
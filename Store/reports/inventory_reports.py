@@ -1,48 +1,163 @@
 from datetime import datetime, timedelta
-from database.models import Sale, Product, Customer, Supply
+from sqlalchemy import func, desc, cast, case, type_coerce, Integer, String
+from database.models import (
+    Product, Customer, DailyRollup, InventoryCheck, Money
+)
+from database.instrumentation import instrumented
 
+# Сколько отдельных продаж и позиций рейтингов выводить в текстовом отчете
+DETAIL_LIMIT = 100
+TOP_LIMIT = 20
+
+# Группировка финансового отчета: формат strftime для ключа периода
+FINANCIAL_PERIODS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'quarter': None,
+    'year': '%Y',
+}
+
+@instrumented
 class InventoryReports:
     """Генерация текстовых отчетов для UI"""
     
     def __init__(self, db_manager):
         self.db = db_manager
     
-    def generate_sales_report(self, start_date=None, end_date=None):
+    def _period(self, start_date, end_date):
         if not start_date:
             start_date = datetime.now() - timedelta(days=30)
         if not end_date:
             end_date = datetime.now()
-        
+        return start_date, end_date
+
+    def aggregate_sales(self, start_date=None, end_date=None):
+        """Сводка продаж за период, посчитанная GROUP BY в базе.
+
+        Возвращает словарь с итогами (count, quantity, revenue) и
+        разбивками by_product, by_category, by_customer, by_day;
+        каждая разбивка - список строк, отсортированный по выручке
+        (by_day - по дате). Архив читается, только если период в него
+        заходит (DatabaseManager.sales_source).
+        """
+        start_date, end_date = self._period(start_date, end_date)
+        sale = self.db.sales_source(start_date)
+        in_period = sale.date.between(start_date, end_date)
+
         session = self.db.Session()
         try:
-            sales = session.query(Sale).filter(
-                Sale.date.between(start_date, end_date)
-            ).all()
-            
-            if not sales:
-                return "Нет данных о продажах за этот период."
-            
-            total_sum = sum(s.total for s in sales)
-            
-            report = f"ОТЧЕТ ПО ПРОДАЖАМ\n{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}\n"
-            report += "=" * 40 + "\n"
-            report += f"Всего продаж: {len(sales)}\n"
-            report += f"Выручка: {total_sum:.2f} ₽\n\n"
-            report += "Детализация:\n"
-            
-            for s in sales:
-                p_name = s.product.name if s.product else "Удален"
-                report += f"- {s.date.strftime('%d.%m %H:%M')} | {p_name} x{s.quantity} = {s.total:.2f}\n"
-                
-            return report
+            totals = session.query(
+                func.count(sale.id).label('count'),
+                func.coalesce(func.sum(sale.quantity), 0).label('quantity'),
+                func.coalesce(func.sum(sale.total), 0).label('revenue')
+            ).filter(in_period).one()
+
+            revenue = func.sum(sale.total).label('revenue')
+            quantity = func.sum(sale.quantity).label('quantity')
+            count = func.count(sale.id).label('count')
+
+            by_product = session.query(
+                sale.product_id, Product.name, count, quantity, revenue
+            ).outerjoin(Product, sale.product_id == Product.id).filter(
+                in_period
+            ).group_by(sale.product_id, Product.name).order_by(desc('revenue')).all()
+
+            by_category = session.query(
+                Product.category, count, quantity, revenue
+            ).join(Product, sale.product_id == Product.id).filter(
+                in_period
+            ).group_by(Product.category).order_by(desc('revenue')).all()
+
+            by_customer = session.query(
+                sale.customer_id, Customer.name, count, revenue
+            ).outerjoin(Customer, sale.customer_id == Customer.id).filter(
+                in_period
+            ).group_by(sale.customer_id, Customer.name).order_by(desc('revenue')).all()
+
+            day = func.date(sale.date).label('day')
+            by_day = session.query(day, count, quantity, revenue).filter(
+                in_period
+            ).group_by(day).order_by(day).all()
+
+            return {
+                'start_date': start_date,
+                'end_date': end_date,
+                'count': totals.count,
+                'quantity': totals.quantity,
+                'revenue': totals.revenue,
+                'by_product': by_product,
+                'by_category': by_category,
+                'by_customer': by_customer,
+                'by_day': by_day,
+            }
         finally:
             session.close()
 
+    def get_sales_details(self, start_date=None, end_date=None, limit=DETAIL_LIMIT, offset=0):
+        """Страница отдельных продаж за период, самые новые сначала"""
+        start_date, end_date = self._period(start_date, end_date)
+        sale = self.db.sales_source(start_date)
+        session = self.db.Session()
+        try:
+            # Только нужные колонки одним JOIN, без ленивой загрузки товара на каждую строку
+            return session.query(
+                sale.id, sale.date, sale.quantity, sale.total, Product.name
+            ).outerjoin(Product, sale.product_id == Product.id).filter(
+                sale.date.between(start_date, end_date)
+            ).order_by(desc(sale.date), desc(sale.id)).limit(limit).offset(offset).all()
+        finally:
+            session.close()
+
+    def generate_sales_report(self, start_date=None, end_date=None, detail_limit=DETAIL_LIMIT):
+        start_date, end_date = self._period(start_date, end_date)
+        summary = self.aggregate_sales(start_date, end_date)
+
+        if not summary['count']:
+            return "Нет данных о продажах за этот период."
+
+        lines = [
+            f"ОТЧЕТ ПО ПРОДАЖАМ\n{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            "=" * 40,
+            f"Всего продаж: {summary['count']}",
+            f"Продано единиц: {summary['quantity']}",
+            f"Выручка: {summary['revenue']:.2f} ₽",
+            "",
+            "По категориям:",
+        ]
+        for row in summary['by_category']:
+            cat_val = row.category.value if hasattr(row.category, 'value') else str(row.category)
+            lines.append(f"- {cat_val}: {row.quantity} шт. = {row.revenue:.2f}")
+
+        lines += ["", f"Топ-{TOP_LIMIT} товаров:"]
+        for row in summary['by_product'][:TOP_LIMIT]:
+            p_name = row.name if row.name is not None else "Удален"
+            lines.append(f"- {p_name}: {row.quantity} шт. = {row.revenue:.2f}")
+
+        lines += ["", f"Топ-{TOP_LIMIT} клиентов:"]
+        for row in summary['by_customer'][:TOP_LIMIT]:
+            c_name = row.name if row.customer_id is not None else "Гость"
+            lines.append(f"- {c_name}: {row.count} продаж = {row.revenue:.2f}")
+
+        lines += ["", "По дням:"]
+        for row in summary['by_day']:
+            lines.append(f"- {row.day}: {row.count} продаж = {row.revenue:.2f}")
+
+        details = self.get_sales_details(start_date, end_date, limit=detail_limit)
+        lines += ["", f"Детализация (последние {len(details)} из {summary['count']}):"]
+        for s in details:
+            p_name = s.name if s.name is not None else "Удален"
+            lines.append(f"- {s.date.strftime('%d.%m %H:%M')} | {p_name} x{s.quantity} = {s.total:.2f}")
+
+        return "\n".join(lines) + "\n"
+
     def generate_inventory_report(self):
         session = self.db.Session()
         try:
-            products = session.query(Product).all()
-            report = "СКЛАДСКОЙ ОТЧЕТ\n" + "=" * 40 + "\n"
+            products = session.query(
+                Product.name, Product.category, Product.quantity,
+                Product.min_stock, Product.price
+            ).all()
+            lines = ["СКЛАДСКОЙ ОТЧЕТ", "=" * 40]
             
             for p in products:
                 cat_val = p.category.value if hasattr(p.category, 'value') else str(p.category)
@@ -50,13 +165,239 @@ class InventoryReports:
                 if p.quantity == 0: status = "ПУСТО"
                 elif p.quantity < p.min_stock: status = "МАЛО"
                 
-                report += f"[{status}] {p.name} ({cat_val})\n"
-                report += f"   Остаток: {p.quantity} шт. | Цена: {p.price} ₽\n"
-                report += "-" * 20 + "\n"
+                lines.append(f"[{status}] {p.name} ({cat_val})")
+                lines.append(f"   Остаток: {p.quantity} шт. | Цена: {p.price} ₽")
+                lines.append("-" * 20)
                 
-            return report
+            return "\n".join(lines) + "\n"
         finally:
             session.close()
     
-    def generate_financial_report(self):
-        return "Финансовый отчет в разработке..."
\ No newline at end of file
+    def shrinkage_by_category(self, start_date=None, end_date=None):
+        """Недостачи и излишки по категориям из записей InventoryCheck за период"""
+        start_date, end_date = self._period(start_date, end_date)
+        session = self.db.Session()
+        try:
+            diff = InventoryCheck.difference
+            return session.query(
+                Product.category,
+                func.count(InventoryCheck.id).label('checked'),
+                func.coalesce(func.sum(case((diff < 0, -diff), else_=0)), 0).label('shortage'),
+                func.coalesce(func.sum(case((diff > 0, diff), else_=0)), 0).label('surplus'),
+                type_coerce(func.coalesce(func.sum(
+                    case((diff < 0, -diff * Product.price), else_=0)
+                ), 0), Money).label('shortage_value'),
+                type_coerce(func.coalesce(func.sum(diff * Product.price), 0), Money).label('net_value'),
+            ).join(Product, InventoryCheck.product_id == Product.id).filter(
+                InventoryCheck.date.between(start_date, end_date)
+            ).group_by(Product.category).order_by(desc('shortage_value')).all()
+        finally:
+            session.close()
+
+    def generate_shrinkage_report(self, start_date=None, end_date=None):
+        start_date, end_date = self._period(start_date, end_date)
+        rows = self.shrinkage_by_category(start_date, end_date)
+        lines = [
+            "НЕДОСТАЧИ ПО ИНВЕНТАРИЗАЦИИ",
+            f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            "=" * 40,
+        ]
+        if not rows:
+            lines.append("Инвентаризаций за период не было")
+        for r in rows:
+            cat_val = r.category.value if hasattr(r.category, 'value') else str(r.category)
+            lines.append(f"{cat_val}: проверено {r.checked}")
+            lines.append(
+                f"   Недостача: {r.shortage} шт. = {r.shortage_value:.2f} ₽ | "
+                f"Излишки: {r.surplus} шт. | Итог: {r.net_value:.2f} ₽"
+            )
+        if rows:
+            lines.append("=" * 40)
+            lines.append(f"Всего недостача: {sum(r.shortage_value for r in rows):.2f} ₽")
+        return "\n".join(lines) + "\n"
+
+    def generate_reorder_report(self, proposals):
+        """Текст предложений заказа от LowStockTracker.reorder_proposals()"""
+        lines = ["ЧТО ЗАКАЗАТЬ", "=" * 40]
+        if not proposals:
+            lines.append("Все товары выше минимального остатка")
+        for p in proposals:
+            lines.append(f"{p.name}: заказать {p.order_quantity} шт.")
+            lines.append(
+                f"   Остаток: {p.quantity} шт. | Минимум: {p.min_stock} | "
+                f"Продажи: {p.daily_sales:.1f} шт./день"
+            )
+        return "\n".join(lines) + "\n"
+
+    def stock_turnover(self, start_date=None, end_date=None):
+        """Оборачиваемость товаров за период по журналу движений остатков.
+
+        Средний остаток взвешен по времени: остаток на начало периода
+        берется из снимка (get_stock_levels_at), дальше каждое движение
+        в периоде держит свой остаток до следующего. Сами интервалы
+        считаются в базе оконной функцией LEAD. Возвращает список
+        словарей (product_id, name, opening, closing, average, sold,
+        turnover, days_of_cover), отсортированный по оборачиваемости.
+        """
+        start_date, end_date = self._period(start_date, end_date)
+        opening = self.db.get_stock_levels_at(start_date)
+        period_days = (end_date - start_date).total_seconds() / 86400
+
+        move = self.db.movements_source(start_date)
+        session = self.db.Session()
+        try:
+            next_date = func.lead(move.date).over(
+                partition_by=move.product_id,
+                order_by=(move.date, move.id)
+            )
+            moves = session.query(
+                move.product_id, move.date, move.kind,
+                move.change, move.quantity, next_date.label('next_date')
+            ).filter(move.date > start_date, move.date <= end_date).subquery()
+            until = func.coalesce(moves.c.next_date, end_date)
+            rows = session.query(
+                moves.c.product_id,
+                func.sum(moves.c.quantity * (func.julianday(until) - func.julianday(moves.c.date)))
+                .label('stock_days'),
+                func.min(moves.c.date).label('first_date'),
+                func.sum(case((moves.c.kind == 'sale', -moves.c.change), else_=0)).label('sold'),
+            ).group_by(moves.c.product_id).all()
+            closing = self.db.get_stock_levels_at(end_date)
+            names = dict(session.query(Product.id, Product.name).all())
+        finally:
+            session.close()
+
+        moved = {r.product_id: r for r in rows}
+        result = []
+        for product_id in set(opening) | set(moved):
+            start_level = opening.get(product_id, 0)
+            r = moved.get(product_id)
+            if r is None:
+                stock_days, sold = start_level * period_days, 0
+            else:
+                before_first = (r.first_date - start_date).total_seconds() / 86400
+                stock_days, sold = r.stock_days + start_level * before_first, r.sold
+            average = stock_days / period_days if period_days else start_level
+            daily_sales = sold / period_days if period_days else 0
+            result.append({
+                'product_id': product_id,
+                'name': names.get(product_id, "Удален"),
+                'opening': start_level,
+                'closing': closing.get(product_id, 0),
+                'average': average,
+                'sold': sold,
+                'turnover': sold / average if average > 0 else None,
+                'days_of_cover': closing.get(product_id, 0) / daily_sales if daily_sales else None,
+            })
+        result.sort(key=lambda r: (r['turnover'] is None, -(r['turnover'] or 0)))
+        return result
+
+    def generate_turnover_report(self, start_date=None, end_date=None):
+        start_date, end_date = self._period(start_date, end_date)
+        rows = self.stock_turnover(start_date, end_date)
+        lines = [
+            "ОБОРАЧИВАЕМОСТЬ ЗАПАСОВ",
+            f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            "=" * 40,
+        ]
+        if not rows:
+            lines.append("Нет данных об остатках за период")
+            return "\n".join(lines) + "\n"
+
+        def describe(r):
+            cover = f"{r['days_of_cover']:.0f} дн." if r['days_of_cover'] is not None else "-"
+            turnover = f"{r['turnover']:.2f}" if r['turnover'] is not None else "-"
+            return [
+                f"- {r['name']}: оборачиваемость {turnover}",
+                f"   Продано: {r['sold']} шт. | Средний остаток: {r['average']:.1f} | "
+                f"Остаток: {r['opening']} -> {r['closing']} | Запас на {cover}",
+            ]
+
+        lines.append(f"Быстрее всего (топ-{TOP_LIMIT}):")
+        for r in rows[:TOP_LIMIT]:
+            lines += describe(r)
+        slow = [r for r in rows if r['closing'] > 0 and not r['sold']]
+        lines += ["", f"Без продаж при наличии остатка: {len(slow)}"]
+        for r in sorted(slow, key=lambda r: -r['closing'])[:TOP_LIMIT]:
+            lines += describe(r)
+        return "\n".join(lines) + "\n"
+
+    def aggregate_financials(self, start_date=None, end_date=None, period='month'):
+        """Финансовые итоги по периодам из дневных итогов daily_rollups.
+
+        Возвращает список словарей (period, revenue, discount, supply_cost,
+        margin), отсортированный по периоду.
+        """
+        if period not in FINANCIAL_PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        if not start_date:
+            start_date = datetime.now() - timedelta(days=365)
+        if not end_date:
+            end_date = datetime.now()
+
+        if period == 'quarter':
+            month = cast(func.strftime('%m', DailyRollup.day), Integer)
+            key = func.strftime('%Y', DailyRollup.day) + '-Q' + cast((month + 2) // 3, String)
+        else:
+            key = func.strftime(FINANCIAL_PERIODS[period], DailyRollup.day)
+        key = key.label('period')
+
+        session = self.db.Session()
+        try:
+            rows = session.query(
+                key,
+                func.sum(DailyRollup.sold_quantity).label('sold_quantity'),
+                func.sum(DailyRollup.revenue).label('revenue'),
+                func.sum(DailyRollup.discount).label('discount'),
+                func.sum(DailyRollup.supplied_quantity).label('supplied_quantity'),
+                func.sum(DailyRollup.supply_cost).label('supply_cost')
+            ).filter(
+                DailyRollup.day.between(start_date.date(), end_date.date())
+            ).group_by(key).order_by(key).all()
+        finally:
+            session.close()
+
+        return [{
+            'period': r.period,
+            'sold_quantity': r.sold_quantity,
+            'revenue': r.revenue,
+            'discount': r.discount,
+            'supplied_quantity': r.supplied_quantity,
+            'supply_cost': r.supply_cost,
+            'margin': r.revenue - r.supply_cost,
+        } for r in rows]
+
+    def generate_financial_report(self, start_date=None, end_date=None, period='month'):
+        if not start_date:
+            start_date = datetime.now() - timedelta(days=365)
+        if not end_date:
+            end_date = datetime.now()
+        rows = self.aggregate_financials(start_date, end_date, period)
+
+        if not rows:
+            return "Нет финансовых данных за этот период."
+
+        revenue = sum(r['revenue'] for r in rows)
+        discount = sum(r['discount'] for r in rows)
+        supply_cost = sum(r['supply_cost'] for r in rows)
+        margin = revenue - supply_cost
+
+        lines = [
+            f"ФИНАНСОВЫЙ ОТЧЕТ\n{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            "=" * 40,
+            f"Выручка: {revenue:.2f} ₽",
+            f"Скидки: {discount:.2f} ₽",
+            f"Затраты на поставки: {supply_cost:.2f} ₽",
+            f"Валовая прибыль: {margin:.2f} ₽",
+        ]
+        if revenue:
+            lines.append(f"Маржа: {margin / revenue * 100:.1f} %")
+
+        lines += ["", "По периодам:"]
+        for r in rows:
+            lines.append(
+                f"- {r['period']}: выручка {r['revenue']:.2f} | скидки {r['discount']:.2f} | "
+                f"поставки {r['supply_cost']:.2f} | прибыль {r['margin']:.2f}"
+            )
+
+        return "\n".join(lines) + "\n"
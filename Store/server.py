@@ -0,0 +1,380 @@
+"""Сервер магазина без интерфейса для нескольких касс.
+
+Сервер один владеет базой. Кассы подключаются по TCP к локальному
+порту и обмениваются JSON-строками:
+
+    -> {"id": 1, "op": "record_sale", "args": {"product_id": 5, "quantity": 1}}
+    <- {"id": 1, "ok": true, "result": {...}}
+    <- {"id": 2, "ok": false, "error": "Недостаточно товара ..."}
+
+Чтения выполняются параллельно в пуле потоков. Все записи идут через
+очередь групповой фиксации DatabaseManager (WriteQueue): она собирает
+запросы, накопившиеся в очереди (до max_batch штук или max_delay
+секунд), и фиксирует их одной транзакцией. Ошибка одной записи
+откатывает только её. Аргументы записей (типы, положительные
+количества и суммы) проверяются до постановки в очередь.
+
+Запуск из каталога Store:
+    python server.py --db sqlite:///store.db --port 8765
+"""
+import argparse
+import asyncio
+import enum
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+from database.db_manager import DatabaseManager, CACHE_SIZE
+from database.models import ProductCategory
+from database.write_queue import MAX_BATCH, MAX_DELAY
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+PORT = 8765
+READ_THREADS = 4
+# Как часто проверять, не пора ли снять остатки (ensure_stock_snapshot), секунды
+SNAPSHOT_CHECK_INTERVAL = 3600
+# Наибольшая длина одной JSON-строки запроса или ответа
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+def to_plain(value):
+    """Преобразовать результат DatabaseManager в JSON-совместимый вид"""
+    if isinstance(value, (list, tuple, set)) and not hasattr(value, '_asdict'):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if hasattr(value, '_asdict'):
+        return {k: to_plain(v) for k, v in value._asdict().items()}
+    if hasattr(value, '__table__'):
+        return {c.name: to_plain(getattr(value, c.name)) for c in value.__table__.columns}
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _date_arg(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+# Проверка аргументов записей от касс: ошибка уходит клиенту ответом
+# {"ok": false}, до базы такие значения не доходят
+def _id(value, name):
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f"Некорректный {name}: {value!r}")
+    return value
+
+
+def _optional_id(value, name):
+    return None if value is None else _id(value, name)
+
+
+def _count(value, name, minimum=1):
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ValueError(f"Некорректное значение {name}: {value!r}")
+    return value
+
+
+def _money(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Некорректная сумма {name}: {value!r}")
+    try:
+        amount = Decimal(str(value))
+    except ArithmeticError:
+        raise ValueError(f"Некорректная сумма {name}: {value!r}")
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"Некорректная сумма {name}: {value!r}")
+    return amount
+
+
+def _sale_line(product_id, quantity, customer_id=None):
+    return (_id(product_id, 'product_id'), _count(quantity, 'quantity'), _optional_id(customer_id, 'customer_id'))
+
+
+def _sale_lines(lines):
+    if not isinstance(lines, list) or not lines:
+        raise ValueError("Нужен непустой список позиций")
+    result = []
+    for line in lines:
+        if not isinstance(line, (list, tuple)) or len(line) not in (2, 3):
+            raise ValueError(f"Некорректная позиция: {line!r}")
+        result.append(_sale_line(*line))
+    return result
+
+
+def _discount(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 100:
+        raise ValueError(f"Некорректная скидка: {value!r}")
+    return float(value)
+
+
+def _text(value, name):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Не заполнено поле {name}")
+    return value
+
+
+def _optional_text(value, name):
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"Некорректное значение {name}: {value!r}")
+    return value
+
+
+def _category(value):
+    try:
+        return ProductCategory[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"Неизвестная категория: {value!r}")
+
+
+# Чтения: имя операции -> функция (db, **args)
+READS = {
+    'ping': lambda db: 'pong',
+    'get_product': lambda db, product_id: db.get_product_by_id(product_id),
+    'find_product': lambda db, barcode: db.find_product_id_by_barcode(barcode),
+    'get_customer': lambda db, customer_id: db.get_customer_by_id(customer_id),
+    'products_page': lambda db, after_id=None, limit=200: db.get_products_page(after_id, limit),
+    'customers_page': lambda db, after_id=None, limit=200: db.get_customers_page(after_id, limit),
+    'sales_page': lambda db, before_id=None, limit=200: db.get_sales_page(before_id, limit),
+    'supplies_page': lambda db, before_id=None, limit=200: db.get_supplies_page(before_id, limit),
+    'low_stock': lambda db: db.get_low_stock_products(),
+    'stock_at': lambda db, product_id, when: db.get_stock_at(product_id, datetime.fromisoformat(when)),
+    'total_sales': lambda db, start_date=None, end_date=None: db.get_total_sales_amount(
+        _date_arg(start_date), _date_arg(end_date)
+    ),
+}
+
+# Записи: имя операции -> (вид для apply_writes, проверка аргументов запроса, результат)
+WRITES = {
+    'record_sale': (
+        'sale',
+        lambda product_id, quantity, customer_id=None: ([_sale_line(product_id, quantity, customer_id)],),
+        lambda sales: sales[0],
+    ),
+    'record_sales': (
+        'sale',
+        lambda lines: (_sale_lines(lines),),
+        None,
+    ),
+    'add_supply': (
+        'supply',
+        lambda supplier, product_id, quantity, cost: (
+            _text(supplier, 'supplier'), _id(product_id, 'product_id'),
+            _count(quantity, 'quantity'), _money(cost, 'cost')
+        ),
+        None,
+    ),
+    'add_product': (
+        'product',
+        lambda name, category, price, quantity=0, min_stock=10, barcode=None, description=None: (
+            _text(name, 'name'), _category(category), _money(price, 'price'),
+            _count(quantity, 'quantity', 0), _count(min_stock, 'min_stock', 0),
+            _optional_text(barcode, 'barcode'), _optional_text(description, 'description')
+        ),
+        None,
+    ),
+    'add_customer': (
+        'customer',
+        lambda name, phone=None, email=None, discount=0.0: (
+            _text(name, 'name'), _optional_text(phone, 'phone'), _optional_text(email, 'email'),
+            _discount(discount)
+        ),
+        None,
+    ),
+}
+
+
+class StoreServer:
+    """asyncio-сервер: параллельные чтения и запись через WriteQueue"""
+
+    def __init__(self, db, host=HOST, port=PORT, max_batch=MAX_BATCH, max_delay=MAX_DELAY,
+                 read_threads=READ_THREADS):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.read_executor = ThreadPoolExecutor(read_threads, thread_name_prefix="store-read")
+        self.reads = 0
+        self._server = None
+        self._snapshot_task = None
+
+    async def start(self):
+        self.db.start_group_commit(self.max_batch, self.max_delay)
+        self._snapshot_task = asyncio.create_task(self._snapshots())
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port, limit=STREAM_LIMIT
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Сервер магазина слушает %s:%s", self.host, self.port)
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._snapshot_task.cancel()
+        self.read_executor.shutdown()
+        await asyncio.get_running_loop().run_in_executor(None, self.db.stop_group_commit)
+
+    async def _snapshots(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.db.ensure_stock_snapshot)
+            except Exception:
+                logger.exception("Не удалось снять остатки")
+            await asyncio.sleep(SNAPSHOT_CHECK_INTERVAL)
+
+    async def execute(self, op, args):
+        """Выполнить операцию op с аргументами args и вернуть результат"""
+        if op == 'stats':
+            write_queue = self.db.write_queue
+            return dict(write_queue.stats, reads=self.reads, queued=write_queue.pending())
+        if op in READS:
+            self.reads += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.read_executor, lambda: READS[op](self.db, **args))
+        if op in WRITES:
+            kind, make_args, convert = WRITES[op]
+            try:
+                write_args = make_args(**args)
+            except TypeError:
+                raise ValueError(f"Некорректные аргументы операции {op}")
+            return await asyncio.wrap_future(self.db.write_queue.submit(kind, write_args, convert))
+        raise Exception(f"Неизвестная операция: {op}")
+
+    async def _handle_client(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(request):
+            response = {'id': None}
+            try:
+                response['id'] = request.get('id')
+                result = await self.execute(request.get('op'), request.get('args') or {})
+                response.update(ok=True, result=to_plain(result))
+            except Exception as e:
+                response.update(ok=False, error=str(e))
+            async with lock:
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    # Не JSON-объект: ответ с ошибкой "Неизвестная операция"
+                    request = {'op': None}
+                # Запросы одного клиента выполняются конвейером,
+                # ответы приходят по мере готовности с тем же id
+                task = asyncio.create_task(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):
+            # ValueError: строка длиннее STREAM_LIMIT
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+
+class StoreClient:
+    """Клиент кассы для StoreServer.
+
+        client = await StoreClient.connect()
+        sale = await client.call('record_sale', product_id=5, quantity=1)
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._next_id = 0
+        self._pending = {}
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host=HOST, port=PORT):
+        reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if response['ok']:
+                    future.set_result(response['result'])
+                else:
+                    future.set_exception(Exception(response['error']))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Соединение с сервером закрыто"))
+
+    async def call(self, op, **args):
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        request = {'id': self._next_id, 'op': op, 'args': args}
+        self.writer.write(json.dumps(request, ensure_ascii=False).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self._reader_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="sqlite:///store.db")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY, help="секунды")
+    parser.add_argument("--read-threads", type=int, default=READ_THREADS)
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help=f"кэш товаров и клиентов, например {CACHE_SIZE}; "
+                             "только если в базу больше никто не пишет")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    db = DatabaseManager(args.db, cache_size=args.cache_size)
+    server = StoreServer(db, args.host, args.port, args.max_batch, args.max_delay, args.read_threads)
+
+    async def run():
+        await server.start()
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Сервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
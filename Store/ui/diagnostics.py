@@ -0,0 +1,101 @@
+import json
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton, QFileDialog
+)
+
+from database.instrumentation import metrics
+
+# Сколько самых затратных запросов и методов показывать
+TOP_ROWS = 25
+
+
+def format_snapshot(snapshot, top=TOP_ROWS):
+    """Текстовая сводка снимка DatabaseManager.diagnostics()"""
+    lines = [f"Метрики с {snapshot['since']} по {snapshot['taken']}", ""]
+
+    def table(title, prefix):
+        rows = [(name[len(prefix):], h) for name, h in snapshot['metrics'].items()
+                if name.startswith(prefix) and name != 'sql:*']
+        lines.append(title)
+        lines.append(f"{'всего, мс':>11} {'вызовов':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'макс':>9}  имя")
+        for name, h in rows[:top]:
+            lines.append(f"{h['total_ms']:11.1f} {h['count']:8} {h['p50_ms']:8} {h['p95_ms']:8} "
+                         f"{h['p99_ms']:8} {h['max_ms']:9.1f}  {name[:160]}")
+        lines.append("")
+
+    table("Методы", "call:")
+    table("SQL-запросы", "sql:")
+
+    lines.append(f"Медленные запросы (от {snapshot.get('slow_query_ms', '?')} мс):")
+    for q in reversed(snapshot['slow_queries']):
+        lines.append(f"  {q['at']} {q['ms']:9.1f} мс  {q['statement'][:160]}")
+    if not snapshot['slow_queries']:
+        lines.append("  нет")
+
+    if 'cache' in snapshot:
+        lines.append("")
+        for name, stats in snapshot['cache'].items():
+            lines.append(f"Кэш {name}: {stats['size']}/{stats['maxsize']}, "
+                         f"попаданий {stats['hit_rate']:.0%}")
+    if 'pool' in snapshot:
+        lines.append(f"Пул соединений: {snapshot['pool']}")
+    if 'write_queue' in snapshot:
+        stats = snapshot['write_queue']
+        average = stats['writes'] / stats['batches'] if stats['batches'] else 0
+        lines.append(f"Групповая фиксация: пачек {stats['batches']}, записей {stats['writes']}, "
+                     f"в среднем {average:.1f}, максимум {stats['max_batch']}, "
+                     f"в очереди {stats['pending']}")
+    return "\n".join(lines)
+
+
+def status_summary():
+    """Короткая строка для строки состояния"""
+    sql = metrics.histogram('sql:*')
+    if sql is None:
+        return "SQL: 0"
+    return f"SQL: {sql.count}, p95 {sql.percentile(95)} мс, медленных {len(metrics.slow_queries)}"
+
+
+class DiagnosticsDialog(QDialog):
+    """Окно диагностики: сводка метрик, сброс и сохранение снимка в JSON"""
+
+    def __init__(self, get_snapshot, parent=None):
+        super().__init__(parent)
+        self.get_snapshot = get_snapshot
+        self.setWindowTitle("Диагностика")
+        self.resize(1000, 600)
+
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.text.setFont(QFont("Consolas", 9))
+        layout.addWidget(self.text)
+
+        buttons = QHBoxLayout()
+        refresh_btn = QPushButton("Обновить")
+        refresh_btn.clicked.connect(self.refresh)
+        reset_btn = QPushButton("Сбросить")
+        reset_btn.clicked.connect(self.reset)
+        save_btn = QPushButton("Сохранить JSON")
+        save_btn.clicked.connect(self.save)
+        buttons.addWidget(refresh_btn)
+        buttons.addWidget(reset_btn)
+        buttons.addStretch()
+        buttons.addWidget(save_btn)
+        layout.addLayout(buttons)
+        self.refresh()
+
+    def refresh(self):
+        self.text.setPlainText(format_snapshot(self.get_snapshot()))
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def save(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить снимок", "diagnostics.json", "JSON (*.json)")
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.get_snapshot(), f, ensure_ascii=False, indent=2)
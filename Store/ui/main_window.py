@@ -3,6 +3,7 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from datetime import datetime
+from ui.product_search import ProductSearchBox
 
 
 class ModernMainWindow(QMainWindow):
@@ -29,8 +30,8 @@ class ModernMainWindow(QMainWindow):
             QTabWidget::pane { border: 1px solid #ddd; background-color: white; border-radius: 6px; }
             QTabBar::tab { background-color: #e8e8e8; padding: 8px 16px; margin-right: 2px; border-top-left-radius: 4px; border-top-right-radius: 4px; }
             QTabBar::tab:selected { background-color: white; font-weight: bold; }
-            QTableWidget { background-color: white; border: 1px solid #ddd; gridline-color: #eee; }
-            QTableWidget::item { padding: 4px; }
+            QTableView { background-color: white; border: 1px solid #ddd; gridline-color: #eee; }
+            QTableView::item { padding: 4px; }
             QHeaderView::section { background-color: #f8f9fa; padding: 8px; border: 1px solid #dee2e6; font-weight: bold; }
             QLineEdit, QComboBox, QSpinBox, QDoubleSpinBox { padding: 6px; border: 1px solid #ddd; border-radius: 4px; background-color: white; }
             QGroupBox { font-weight: bold; border: 2px solid #4CAF50; border-radius: 6px; margin-top: 10px; padding-top: 10px; }
@@ -48,10 +49,21 @@ class ModernMainWindow(QMainWindow):
         file_menu.addAction(export_action)
         self.export_action = export_action  # Save ref
 
+        import_menu = file_menu.addMenu('Импорт')
+        self.import_products_action = import_menu.addAction('Товары...')
+        self.import_customers_action = import_menu.addAction('Клиенты...')
+        self.import_supplies_action = import_menu.addAction('Поставки...')
+        self.stock_take_action = file_menu.addAction('Инвентаризация...')
+
         exit_action = QAction('Выход', self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
 
+        service_menu = menubar.addMenu('Сервис')
+        self.diagnostics_action = service_menu.addAction('Диагностика...')
+        self.archive_action = service_menu.addAction('Архивировать старые данные...')
+        self.refresh_report_data_action = service_menu.addAction('Обновить данные отчетов')
+
     def create_tabs(self):
         self.tab_widget = QTabWidget()
         self.setCentralWidget(self.tab_widget)
@@ -71,6 +83,13 @@ class ModernMainWindow(QMainWindow):
         self.reports_tab = self.create_reports_tab()
         self.tab_widget.addTab(self.reports_tab, "📊 Отчеты")
 
+    def create_table_view(self):
+        """Таблица только для чтения с выделением строк целиком"""
+        view = QTableView()
+        view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        return view
+
     def create_products_tab(self):
         tab = QWidget()
         layout = QVBoxLayout()
@@ -112,12 +131,8 @@ class ModernMainWindow(QMainWindow):
         form_layout.addWidget(self.product_min_stock_input, 4, 1)
         form_panel.setLayout(form_layout)
 
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(7)
-        self.products_table.setHorizontalHeaderLabels(
-            ["ID", "Название", "Категория", "Цена", "Количество", "Минимум", "Статус"])
-        self.products_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.products_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # Модель с данными назначает StoreApp
+        self.products_table = self.create_table_view()
 
         layout.addWidget(control_panel)
         layout.addWidget(form_panel)
@@ -132,8 +147,8 @@ class ModernMainWindow(QMainWindow):
         sales_layout = QGridLayout()
 
         sales_layout.addWidget(QLabel("Товар:"), 0, 0)
-        self.sale_product_combo = QComboBox()
-        sales_layout.addWidget(self.sale_product_combo, 0, 1)
+        self.sale_product_search = ProductSearchBox()
+        sales_layout.addWidget(self.sale_product_search, 0, 1)
 
         sales_layout.addWidget(QLabel("Количество:"), 1, 0)
         self.sale_quantity_spin = QSpinBox()
@@ -148,9 +163,7 @@ class ModernMainWindow(QMainWindow):
         sales_layout.addWidget(self.process_sale_btn, 3, 0, 1, 2)
         sales_control.setLayout(sales_layout)
 
-        self.sales_history_table = QTableWidget()
-        self.sales_history_table.setColumnCount(6)
-        self.sales_history_table.setHorizontalHeaderLabels(["ID", "Дата", "Товар", "Количество", "Сумма", "Клиент"])
+        self.sales_history_table = self.create_table_view()
 
         layout.addWidget(sales_control)
         layout.addWidget(QLabel("<b>История продаж:</b>"))
@@ -169,8 +182,8 @@ class ModernMainWindow(QMainWindow):
         form_layout.addWidget(self.supplier_input, 0, 1)
 
         form_layout.addWidget(QLabel("Товар:"), 1, 0)
-        self.supply_product_combo = QComboBox()
-        form_layout.addWidget(self.supply_product_combo, 1, 1)
+        self.supply_product_search = ProductSearchBox()
+        form_layout.addWidget(self.supply_product_search, 1, 1)
 
         form_layout.addWidget(QLabel("Количество:"), 2, 0)
         self.supply_quantity_spin = QSpinBox()
@@ -186,9 +199,7 @@ class ModernMainWindow(QMainWindow):
         form_layout.addWidget(self.add_supply_btn, 4, 0, 1, 2)
         supply_form.setLayout(form_layout)
 
-        self.supplies_table = QTableWidget()
-        self.supplies_table.setColumnCount(6)
-        self.supplies_table.setHorizontalHeaderLabels(["ID", "Дата", "Поставщик", "Товар", "Количество", "Стоимость"])
+        self.supplies_table = self.create_table_view()
 
         layout.addWidget(supply_form)
         layout.addWidget(QLabel("<b>История поставок:</b>"))
@@ -221,9 +232,7 @@ class ModernMainWindow(QMainWindow):
         form_layout.addWidget(self.add_customer_btn, 4, 0, 1, 2)
         customer_form.setLayout(form_layout)
 
-        self.customers_table = QTableWidget()
-        self.customers_table.setColumnCount(5)
-        self.customers_table.setHorizontalHeaderLabels(["ID", "Имя", "Телефон", "Email", "Скидка"])
+        self.customers_table = self.create_table_view()
 
         layout.addWidget(customer_form)
         layout.addWidget(QLabel("<b>Список клиентов:</b>"))
@@ -246,6 +255,12 @@ class ModernMainWindow(QMainWindow):
         reports_layout.addWidget(self.inventory_report_btn, 0, 1)
         reports_layout.addWidget(self.financial_report_btn, 1, 0)
         reports_layout.addWidget(self.export_excel_btn, 1, 1)
+        self.reorder_report_btn = QPushButton("🚚 Что заказать")
+        reports_layout.addWidget(self.reorder_report_btn, 2, 0)
+        self.shrinkage_report_btn = QPushButton("🔍 Недостачи")
+        reports_layout.addWidget(self.shrinkage_report_btn, 2, 1)
+        self.turnover_report_btn = QPushButton("🔄 Оборачиваемость")
+        reports_layout.addWidget(self.turnover_report_btn, 3, 0)
         reports_panel.setLayout(reports_layout)
 
         stats_panel = QGroupBox("Статистика магазина")
@@ -273,4 +288,19 @@ class ModernMainWindow(QMainWindow):
 
     def create_status_bar(self):
         self.status_bar = self.statusBar()
-        self.status_bar.showMessage("Готово")
\ No newline at end of file
+        self.status_bar.showMessage("Готово")
+
+        # Прогресс фоновой задачи (экспорт, отчеты)
+        self.task_progress = QProgressBar()
+        self.task_progress.setMaximumWidth(200)
+        self.task_progress.setVisible(False)
+        self.cancel_task_btn = QPushButton("Отмена", objectName="danger")
+        self.cancel_task_btn.setVisible(False)
+        self.low_stock_label = QLabel()
+        self.status_bar.addPermanentWidget(self.low_stock_label)
+        self.report_age_label = QLabel()
+        self.status_bar.addPermanentWidget(self.report_age_label)
+        self.sql_stats_label = QLabel()
+        self.status_bar.addPermanentWidget(self.sql_stats_label)
+        self.status_bar.addPermanentWidget(self.task_progress)
+        self.status_bar.addPermanentWidget(self.cancel_task_btn)
\ No newline at end of file
@@ -0,0 +1,85 @@
+from PyQt5.QtCore import Qt, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import QCompleter, QLineEdit
+
+from database.search_index import ProductSearchIndex
+
+
+class ProductSearchBox(QLineEdit):
+    """Поле выбора товара с подсказками по мере ввода.
+
+    Подсказки берутся из общего ProductSearchIndex (только первые limit
+    совпадений), Enter со штрихкодом сразу выбирает товар. Если индекс
+    еще не построен, штрихкод ищется через barcode_lookup (запрос к базе
+    по уникальному индексу).
+    """
+    productSelected = pyqtSignal(object)
+
+    def __init__(self, limit=20, parent=None):
+        super().__init__(parent)
+        self.limit = limit
+        self.index = ProductSearchIndex()
+        self.barcode_lookup = None
+        self._product_id = None
+
+        self._model = QStandardItemModel(self)
+        self._completer = QCompleter(self._model, self)
+        self._completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self._completer.setWidget(self)
+        self._completer.activated[QModelIndex].connect(self._on_activated)
+
+        self.setPlaceholderText("Название или штрихкод")
+        self.textEdited.connect(self._on_text_edited)
+        self.returnPressed.connect(self._on_return)
+
+    @staticmethod
+    def label(entry):
+        name, _, quantity = entry
+        return f"{name} ({quantity} шт.)"
+
+    def set_index(self, index):
+        self.index = index
+        self.refresh_labels()
+
+    def currentData(self):
+        """id выбранного товара или None"""
+        return self._product_id
+
+    def select_product(self, product_id):
+        entry = self.index.products.get(product_id)
+        self._product_id = product_id
+        self.setText(self.label(entry) if entry else str(product_id))
+        self.productSelected.emit(product_id)
+
+    def refresh_labels(self):
+        """Обновить подпись выбранного товара (например, остаток после продажи)"""
+        if self._product_id in self.index.products:
+            self.setText(self.label(self.index.products[self._product_id]))
+
+    def _on_text_edited(self, text):
+        self._product_id = None
+        self._model.clear()
+        for product_id in self.index.search(text, self.limit):
+            item = QStandardItem(self.label(self.index.products[product_id]))
+            item.setData(product_id, Qt.UserRole)
+            self._model.appendRow(item)
+        if self._model.rowCount():
+            self._completer.complete()
+        else:
+            self._completer.popup().hide()
+
+    def _on_activated(self, model_index):
+        product_id = model_index.data(Qt.UserRole)
+        if product_id is not None:
+            self.select_product(product_id)
+
+    def _on_return(self):
+        if self._product_id is not None:
+            return
+        code = self.text().strip()
+        product_id = self.index.lookup_barcode(code)
+        if product_id is None and self.barcode_lookup and code:
+            product_id = self.barcode_lookup(code)
+        if product_id is not None:
+            self._completer.popup().hide()
+            self.select_product(product_id)
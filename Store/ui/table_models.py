@@ -0,0 +1,129 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+
+
+class LazyTableModel(QAbstractTableModel):
+    """Модель таблицы, подгружающая строки из базы страницами.
+
+    fetch_page(last_key, limit) возвращает следующую страницу строк
+    после строки с ключом last_key (None - первая страница);
+    format_row(row) превращает строку в кортеж текстов для колонок.
+    Представление само запрашивает следующую страницу через
+    canFetchMore/fetchMore, когда пользователь докручивает до конца.
+
+    fetch_rows(keys) возвращает актуальные строки по ключам; через него
+    apply_changes обновляет только изменившиеся строки. newest_first
+    означает, что строки упорядочены по убыванию ключа и новые записи
+    появляются сверху.
+    """
+
+    def __init__(self, headers, fetch_page, format_row, fetch_rows=None, newest_first=False,
+                 page_size=200, key=None, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.fetch_page = fetch_page
+        self.format_row = format_row
+        self.fetch_rows = fetch_rows
+        self.newest_first = newest_first
+        self.page_size = page_size
+        self.key = key or (lambda row: row.id)
+        self._keys = []
+        self._cells = []
+        self._positions = {}
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._cells)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return QVariant()
+        return self._cells[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        last_key = self._keys[-1] if self._keys else None
+        rows = self.fetch_page(last_key, self.page_size)
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            return
+        first = len(self._cells)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for row in rows:
+            self._positions[self.key(row)] = len(self._keys)
+            self._keys.append(self.key(row))
+            self._cells.append(tuple(self.format_row(row)))
+        self.endInsertRows()
+
+    def reload(self):
+        """Сбросить загруженные строки и начать с первой страницы"""
+        self.beginResetModel()
+        self._keys = []
+        self._cells = []
+        self._positions = {}
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def apply_changes(self, keys):
+        """Обновить загруженные строки с этими ключами и добавить новые.
+
+        Новые строки вставляются, только если они попадают в уже
+        загруженную часть таблицы; остальные придут со следующей страницей.
+        """
+        keys = set(keys)
+        if not keys:
+            return
+        wanted = {k for k in keys if k in self._positions}
+        if self.newest_first:
+            top = self._keys[0] if self._keys else None
+            new_keys = {k for k in keys if k not in self._positions and (top is None or k > top)}
+        elif self._exhausted:
+            last = self._keys[-1] if self._keys else None
+            new_keys = {k for k in keys if k not in self._positions and (last is None or k > last)}
+        else:
+            new_keys = set()
+        if not wanted and not new_keys:
+            return
+
+        rows = {self.key(row): row for row in self.fetch_rows(wanted | new_keys)}
+
+        for key in wanted:
+            position = self._positions[key]
+            if key not in rows:
+                continue
+            self._cells[position] = tuple(self.format_row(rows[key]))
+            self.dataChanged.emit(self.index(position, 0),
+                                  self.index(position, len(self.headers) - 1))
+
+        added = sorted((k for k in new_keys if k in rows), reverse=self.newest_first)
+        if not added:
+            return
+        first = 0 if self.newest_first else len(self._keys)
+        self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+        cells = [tuple(self.format_row(rows[k])) for k in added]
+        self._keys[first:first] = added
+        self._cells[first:first] = cells
+        if self.newest_first:
+            self._positions = {k: i for i, k in enumerate(self._keys)}
+        else:
+            for i, k in enumerate(added):
+                self._positions[k] = first + i
+        self.endInsertRows()
+
+    def key_at(self, row):
+        return self._keys[row]
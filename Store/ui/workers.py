@@ -0,0 +1,107 @@
+import logging
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class CancelToken:
+    """Флаг отмены, который долгая операция периодически проверяет"""
+
+    def __init__(self):
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def __call__(self):
+        return self._cancelled
+
+
+class TaskSignals(QObject):
+    """Сигналы задачи; доставляются в поток интерфейса"""
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    cancelled = pyqtSignal()
+
+
+class Task(QRunnable):
+    """Вызов функции в пуле потоков.
+
+    При with_progress=True функция получает именованные аргументы
+    progress(done, total) и cancel() -> bool.
+    """
+
+    def __init__(self, fn, args, kwargs, with_progress=False):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.with_progress = with_progress
+        self.token = CancelToken()
+        self.signals = TaskSignals()
+
+    def run(self):
+        kwargs = dict(self.kwargs)
+        if self.with_progress:
+            kwargs['progress'] = self.signals.progress.emit
+            kwargs['cancel'] = self.token
+        try:
+            result = self.fn(*self.args, **kwargs)
+        except Exception as e:
+            logger.exception("Ошибка фоновой задачи")
+            self.signals.failed.emit(str(e))
+            return
+        if self.token():
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
+
+
+class TaskRunner(QObject):
+    """Выполняет операции с базой, отчеты и экспорт вне потока интерфейса.
+
+    Обработчики on_done/on_error/on_progress/on_cancel вызываются
+    в потоке интерфейса через очередь сигналов Qt.
+    """
+
+    def __init__(self, max_threads=4, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._tasks = set()
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None,
+               on_cancel=None, with_progress=False, **kwargs):
+        """Запустить fn(*args, **kwargs) в пуле; возвращает CancelToken"""
+        task = Task(fn, args, kwargs, with_progress)
+        task.setAutoDelete(False)
+        if on_done:
+            task.signals.finished.connect(on_done)
+        if on_error:
+            task.signals.failed.connect(on_error)
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        if on_cancel:
+            task.signals.cancelled.connect(on_cancel)
+        for signal in (task.signals.finished, task.signals.failed, task.signals.cancelled):
+            signal.connect(lambda *_, t=task: self._tasks.discard(t))
+        self._tasks.add(task)
+        self.pool.start(task)
+        return task.token
+
+    def wait(self, msecs=-1):
+        """Дождаться завершения всех задач (при закрытии приложения)"""
+        return self.pool.waitForDone(msecs)
+
+
+class ChangeRelay(QObject):
+    """Передает события изменений DatabaseManager в поток интерфейса.
+
+    Подписчики DatabaseManager вызываются в том потоке, где прошла
+    запись; сигнал Qt доставит их в поток, которому принадлежит relay.
+    """
+    changed = pyqtSignal(object)
+
+    def __call__(self, changes):
+        self.changed.emit(changes)